@@ -7,43 +7,104 @@ Module Grid Generator
 from PIL import Image
 import numpy as np
 import os
+import sys
+import base64
+import hashlib
+import json
+import tempfile
+import threading
+import zlib
+import xml.etree.ElementTree as ET
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from io import BytesIO
 from pathlib import Path
 
 
+# 벡터 출력으로 저장할 확장자
+VECTOR_EXTENSIONS = ('.svg', '.pdf')
+
+# grid_size='auto'에서 예산을 지정하지 않았을 때의 결과 최대 픽셀 수
+AUTO_GRID_MAX_PIXELS = 100 * 1000 * 1000
+
+# 모듈 아틀라스 캐시 폴더 (여러 워커/프로세스가 같은 파일을 메모리 맵으로 공유)
+ATLAS_FOLDER = os.environ.get('MODULE_ATLAS_DIR', os.path.join(tempfile.gettempdir(), 'module_atlas'))
+
+# 아틀라스 캐시 폴더 최대 크기 (넘으면 가장 오래 쓰지 않은 아틀라스부터 삭제)
+ATLAS_MAX_BYTES = int(os.environ.get('MODULE_ATLAS_MAX_MB', 1024)) * 1024 * 1024
+
+# 크기가 다른 모듈을 정규화한 타일 캐시 폴더 (원본 내용 해시 + 타일 크기 + 맞춤 방식으로 저장)
+TILE_CACHE_FOLDER = os.environ.get('MODULE_TILE_CACHE_DIR', os.path.join(ATLAS_FOLDER, 'normalized'))
+
+# 정규화 타일 캐시 폴더 최대 크기, 프로세스 메모리에 들고 있을 최대 타일 수
+TILE_CACHE_MAX_BYTES = int(os.environ.get('MODULE_TILE_CACHE_MAX_MB', 256)) * 1024 * 1024
+TILE_MEMORY_CACHE_SIZE = 256
+
+# 모듈 맞춤 방식: crop(짧은 변 기준 확대 후 가운데 자르기), pad(긴 변 기준 축소 후 흰색 여백), stretch(비율 무시)
+MODULE_FIT_POLICIES = ('crop', 'pad', 'stretch')
+
+
 class ModuleGridGenerator:
-    def __init__(self, module_folder, target_image, grid_size=None, output_dpi=300):
+    def __init__(self, module_folder, target_image, grid_size=None, output_dpi=300, max_output_pixels=None,
+                 max_file_mb=None):
         """
         Args:
             module_folder: 모듈 이미지들이 있는 폴더 경로
             target_image: 형상으로 만들 이미지 경로
-            grid_size: (cols, rows) 튜플. None이면 자동 계산
+            grid_size: (cols, rows) 튜플. None이면 자동 계산, 'auto'면 타겟마다 품질 기반 탐색
             output_dpi: 출력 해상도 (기본 300)
+            max_output_pixels: 'auto' 탐색 시 결과 이미지 최대 픽셀 수
+            max_file_mb: 'auto' 탐색 시 결과 파일 최대 크기 (비압축 RGB 기준 MB)
         """
         self.module_folder = module_folder
         self.target_image = target_image
-        self.grid_size = grid_size
+        self.auto_grid = grid_size == 'auto'
+        self.grid_size = None if self.auto_grid else grid_size
         self.output_dpi = output_dpi
+        self.max_output_pixels = max_output_pixels
+        self.max_file_mb = max_file_mb
         self.modules = []
         self.module_brightness = []
         self.module_names = []  # 모듈 파일명 저장
         self.module_usage_count = {}  # 모듈 사용 횟수 카운트
+        self.placement = None  # 셀별 모듈 인덱스 (rows, cols)
+
+    def analyze_modules(self, use_atlas=False, tile_size=None, fit='crop'):
+        """모듈 이미지들의 평균 밝기 분석
 
-    def analyze_modules(self):
-        """모듈 이미지들의 평균 밝기 분석"""
+        Args:
+            use_atlas: True면 공유 모듈 아틀라스(ModuleAtlas)에서 읽기 전용으로 매핑.
+                       같은 라이브러리는 프로세스/워커 간에 한 번만 디코딩된다.
+            tile_size: 모듈을 맞출 정사각형 타일 크기. None이면 모듈 크기가 모두 같을 때는 그대로,
+                       다르면 짧은 변의 중앙값
+            fit: 크기가 다른 모듈의 맞춤 방식 ('crop', 'pad', 'stretch')
+        """
         print("📊 모듈 분석 중...")
 
+        if use_atlas:
+            atlas = ModuleAtlas.load(self.module_folder, tile_size=tile_size, fit=fit)
+            self.modules = atlas.images()
+            self.module_brightness = list(atlas.brightness)
+            self.module_names = list(atlas.names)
+            self.module_usage_count = {name: 0 for name in self.module_names}
+            print(f"  아틀라스 사용: {atlas.path}")
+
+            print(f"✅ {len(self.modules)}개 모듈 분석 완료")
+            print(f"   밝기 범위: {self.module_brightness[0]:.1f} (어두움) ~ {self.module_brightness[-1]:.1f} (밝음)\n")
+            return self
+
         # PNG, JPG 파일 모두 지원
-        module_files = list(Path(self.module_folder).glob('*.png'))
-        module_files.extend(Path(self.module_folder).glob('*.jpg'))
-        module_files.extend(Path(self.module_folder).glob('*.jpeg'))
-        module_files = sorted(module_files)
+        module_files = find_module_files(self.module_folder)
 
         if not module_files:
             raise FileNotFoundError(f"모듈 폴더에서 이미지를 찾을 수 없습니다: {self.module_folder}")
 
-        for module_file in module_files:
-            img = Image.open(module_file).convert('L')  # 그레이스케일 변환
-            brightness = np.array(img).mean()  # 평균 밝기 (0=검정, 255=흰색)
+        # 그레이스케일 변환 (크기가 다르면 공통 타일 크기로 정규화)
+        tiles = load_module_tiles(module_files, tile_size=tile_size, fit=fit)
+
+        for module_file, tile in zip(module_files, tiles):
+            img = Image.fromarray(tile)
+            brightness = tile.mean()  # 평균 밝기 (0=검정, 255=흰색)
 
             self.modules.append(img)
             self.module_brightness.append(brightness)
@@ -61,6 +122,22 @@ class ModuleGridGenerator:
         print(f"   밝기 범위: {self.module_brightness[0]:.1f} (어두움) ~ {self.module_brightness[-1]:.1f} (밝음)\n")
         return self
 
+    def copy_for_target(self, target_image):
+        """분석된 모듈을 공유하고 타겟/사용 통계만 새로 가지는 생성기 (동시 처리용)"""
+        generator = ModuleGridGenerator(
+            module_folder=self.module_folder,
+            target_image=target_image,
+            grid_size='auto' if self.auto_grid else self.grid_size,
+            output_dpi=self.output_dpi,
+            max_output_pixels=self.max_output_pixels,
+            max_file_mb=self.max_file_mb
+        )
+        generator.modules = self.modules
+        generator.module_brightness = self.module_brightness
+        generator.module_names = self.module_names
+        generator.module_usage_count = {name: 0 for name in self.module_names}
+        return generator
+
     def prepare_target_image(self):
         """타겟 이미지를 그리드로 변환"""
         print("🖼️  타겟 이미지 분석 중...")
@@ -71,8 +148,22 @@ class ModuleGridGenerator:
         target = Image.open(self.target_image).convert('L')
         print(f"  원본 크기: {target.width} x {target.height} 픽셀")
 
+        cols, rows = self.resolve_grid_size(target)
+
+        # 타겟 이미지를 그리드 크기로 리사이즈
+        resized = target.resize((cols, rows), Image.Resampling.LANCZOS)
+        self.grid_brightness = np.array(resized)
+
+        print(f"✅ 이미지 그리드 변환 완료\n")
+        return self
+
+    def resolve_grid_size(self, target, invert=False):
+        """타겟(그레이스케일 PIL 이미지)에 쓸 그리드 크기 결정 - 지정값, 자동 계산, 품질 기반 탐색"""
+        # 품질 기반 그리드 탐색 (타겟마다)
+        if self.auto_grid:
+            cols, rows = self.auto_grid_size(target, invert=invert)
         # 그리드 크기 자동 계산 (미지정 시)
-        if self.grid_size is None:
+        elif self.grid_size is None:
             # 모듈이 최소 50x50 픽셀 정도 되도록
             module_size = self.modules[0].size[0]
             target_module_size = max(50, module_size // 2)
@@ -83,13 +174,98 @@ class ModuleGridGenerator:
         else:
             cols, rows = self.grid_size
             print(f"  지정된 그리드: {cols} x {rows}")
+        return cols, rows
 
-        # 타겟 이미지를 그리드 크기로 리사이즈
-        resized = target.resize((cols, rows), Image.Resampling.LANCZOS)
-        self.grid_brightness = np.array(resized)
+    def auto_grid_size(self, target=None, candidates=None, signature_size=4, eval_size=256, tolerance=0.01,
+                       invert=False):
+        """
+        저해상도 시뮬레이션으로 그리드 크기 탐색
 
-        print(f"✅ 이미지 그리드 변환 완료\n")
-        return self
+        각 후보 그리드마다 모듈을 signature_size x signature_size로 축소한 서명으로
+        결과를 흉내 낸 뒤, eval_size 해상도부터 절반씩 줄인 여러 해상도에서 타겟과 SSIM을 비교한다.
+        (거친 해상도는 형상 재현, 고운 해상도는 모듈 질감의 영향을 반영)
+        예산(max_output_pixels, max_file_mb, 둘 다 없으면 AUTO_GRID_MAX_PIXELS) 안의 후보 중
+        최고 점수와 tolerance 이내인 가장 작은 그리드를 고른다.
+
+        Args:
+            target: 그레이스케일 PIL 이미지 (None이면 self.target_image에서 읽음)
+            candidates: 후보 열(cols) 수 목록 (None이면 10 ~ 타겟 너비 사이 로그 간격)
+            signature_size: 모듈 서명 크기 (픽셀)
+            eval_size: 비교 해상도 (긴 변 픽셀)
+            tolerance: 최고 점수와의 허용 차이
+            invert: True면 명암 반전 결과 기준으로 평가
+
+        Returns:
+            (cols, rows) 튜플 (self.grid_size에도 저장)
+        """
+        if target is None:
+            target = Image.open(self.target_image).convert('L')
+
+        module_size = self.modules[0].size[0]
+        aspect = target.height / target.width
+        max_output_pixels = self.max_output_pixels
+        if max_output_pixels is None and self.max_file_mb is None:
+            max_output_pixels = AUTO_GRID_MAX_PIXELS
+
+        # 비교용 타겟 (긴 변 eval_size)
+        scale = eval_size / max(target.width, target.height)
+        eval_width = max(8, round(target.width * scale))
+        eval_height = max(8, round(target.height * scale))
+        reference = np.asarray(target.resize((eval_width, eval_height), Image.Resampling.BOX), dtype=np.float64)
+        if invert:
+            reference = 255 - reference
+        # 모듈 밝기 범위 밖의 명암은 어떤 그리드로도 재현할 수 없으므로 비교에서 제외
+        reference = np.clip(reference, self.module_brightness[0], self.module_brightness[-1])
+
+        signatures = np.stack([
+            np.asarray(module.resize((signature_size, signature_size), Image.Resampling.BOX))
+            for module in self.modules
+        ])
+
+        if candidates is None:
+            candidates = np.unique(np.geomspace(10, max(10, target.width), num=24).astype(int))
+
+        # 예산 안에 들어가는 후보만 남김
+        budget_candidates = []
+        for cols in candidates:
+            cols = int(cols)
+            rows = max(1, round(cols * aspect))
+            output_pixels = cols * rows * module_size * module_size
+            if max_output_pixels and output_pixels > max_output_pixels:
+                continue
+            if self.max_file_mb and output_pixels * 3 / (1024 * 1024) > self.max_file_mb:
+                continue
+            budget_candidates.append((cols, rows))
+
+        if not budget_candidates:
+            raise ValueError("예산 안에 들어가는 그리드 후보가 없습니다. max_output_pixels / max_file_mb를 늘려주세요.")
+
+        print(f"  그리드 탐색: 후보 {len(budget_candidates)}개, 평가 해상도 {eval_width} x {eval_height}")
+
+        # 타겟은 가장 큰 후보 크기까지 한 번만 축소해 두고, 후보마다 축소본에서 리사이즈
+        max_cols = max(cols for cols, _ in budget_candidates)
+        max_rows = max(rows for _, rows in budget_candidates)
+        factor = max(1, min(target.width // max_cols, target.height // max_rows))
+        reduced = target.reduce(factor) if factor > 1 else target
+
+        scores = []
+        for cols, rows in budget_candidates:
+            grid = np.asarray(reduced.resize((cols, rows), Image.Resampling.LANCZOS))
+            placement = self._match_brightness(grid, invert)
+            simulated = signatures[placement].transpose(0, 2, 1, 3).reshape(rows * signature_size,
+                                                                            cols * signature_size)
+            simulated = Image.fromarray(simulated).resize((eval_width, eval_height), Image.Resampling.BOX)
+            score = multiscale_ssim(np.asarray(simulated, dtype=np.float64), reference)
+            scores.append((score, cols, rows))
+
+        best_score = max(score for score, _, _ in scores)
+        score, cols, rows = min(
+            (entry for entry in scores if entry[0] >= best_score - tolerance),
+            key=lambda entry: entry[1] * entry[2]
+        )
+        self.grid_size = (cols, rows)
+        print(f"  탐색된 그리드: {cols} x {rows} (SSIM {score:.3f}, 최고 {best_score:.3f})")
+        return self.grid_size
 
     def match_module(self, brightness):
         """밝기 값에 가장 가까운 모듈 선택"""
@@ -102,53 +278,231 @@ class ModuleGridGenerator:
 
         return self.modules[best_index]
 
-    def generate(self, output_path='output.png', invert=False, md_folder=None):
+    def _match_brightness(self, brightness, invert=False):
+        """밝기 배열의 각 값에 가장 가까운 모듈 인덱스 배열 반환"""
+        if invert:
+            brightness = 255 - brightness
+
+        # module_brightness는 정렬되어 있으므로 인접 모듈 밝기의 중간값으로 구간을 나눠 이진 탐색
+        # (셀 x 모듈 거리 행렬 없이 O(셀) 메모리, 중간값에 걸리면 argmin처럼 어두운 쪽 선택)
+        module_brightness = np.asarray(self.module_brightness, dtype=np.float64)
+        midpoints = (module_brightness[:-1] + module_brightness[1:]) / 2
+        indices = np.searchsorted(midpoints, brightness, side='left')
+
+        # 밝기가 같은 모듈이 여럿이면 argmin처럼 첫 번째 모듈로
+        first_equal = np.searchsorted(module_brightness, module_brightness, side='left')
+        return first_equal[indices]
+
+    def build_placement(self, invert=False):
+        """그리드 셀마다 사용할 모듈 인덱스 계산 (match_module의 벡터화 버전)
+
+        Args:
+            invert: True면 명암 반전
+
+        Returns:
+            (rows, cols) 모듈 인덱스 배열
+        """
+        placement = self._match_brightness(self.grid_brightness, invert)
+        if len(self.modules) <= np.iinfo(np.uint16).max + 1:
+            placement = placement.astype(np.uint16)  # 셀당 2바이트 (배치 맵 파일과 같은 형식)
+
+        # 사용 횟수 갱신
+        self._set_usage(np.bincount(placement.ravel(), minlength=len(self.module_names)))
+
+        self.placement = placement
+        return placement
+
+    def _module_png(self, index):
+        """모듈 이미지를 PNG 바이트로 인코딩"""
+        buffered = BytesIO()
+        self.modules[index].save(buffered, format='PNG', optimize=True)
+        return buffered.getvalue()
+
+    def save_svg(self, output_path, placement):
+        """모듈마다 <symbol>을 한 번만 넣고 셀은 <use>로 배치한 SVG 저장"""
+        rows, cols = placement.shape
+        module_size = self.modules[0].size[0]
+        width = cols * module_size
+        height = rows * module_size
+        width_mm = width / self.output_dpi * 25.4
+        height_mm = height / self.output_dpi * 25.4
+
+        with open(output_path, 'w', encoding='utf-8') as f:
+            f.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+            f.write(f'<svg xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink" '
+                    f'width="{width_mm:.3f}mm" height="{height_mm:.3f}mm" viewBox="0 0 {width} {height}">\n')
+
+            # 사용된 모듈만 한 번씩 정의
+            f.write('<defs>\n')
+            for index in np.unique(placement):
+                data = base64.b64encode(self._module_png(index)).decode()
+                f.write(f'<symbol id="m{index}" viewBox="0 0 {module_size} {module_size}">'
+                        f'<image width="{module_size}" height="{module_size}" '
+                        f'xlink:href="data:image/png;base64,{data}"/></symbol>\n')
+            f.write('</defs>\n')
+
+            # 셀 배치
+            for row in range(rows):
+                y = row * module_size
+                f.write(''.join(
+                    f'<use xlink:href="#m{index}" x="{col * module_size}" y="{y}" '
+                    f'width="{module_size}" height="{module_size}"/>\n'
+                    for col, index in enumerate(placement[row].tolist())
+                ))
+            f.write('</svg>\n')
+
+    def save_pdf(self, output_path, placement):
+        """모듈마다 이미지 XObject를 한 번만 넣고 셀은 Do 연산자로 배치한 PDF 저장"""
+        rows, cols = placement.shape
+        module_size = self.modules[0].size[0]
+        cell = module_size * 72 / self.output_dpi  # 포인트 단위 셀 크기
+        page_width = cols * cell
+        page_height = rows * cell
+        used = np.unique(placement)
+
+        # 오브젝트 번호: 1=Catalog, 2=Pages, 3=Page, 4=Contents, 5~=모듈 이미지
+        image_ids = {int(index): 5 + i for i, index in enumerate(used)}
+
+        content = []
+        for row in range(rows):
+            y = page_height - (row + 1) * cell
+            for col, index in enumerate(placement[row].tolist()):
+                content.append(f'q {cell:.4f} 0 0 {cell:.4f} {col * cell:.4f} {y:.4f} cm /M{index} Do Q')
+        content = zlib.compress('\n'.join(content).encode('ascii'))
+
+        objects = [
+            b'<< /Type /Catalog /Pages 2 0 R >>',
+            b'<< /Type /Pages /Kids [3 0 R] /Count 1 >>',
+            (f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {page_width:.4f} {page_height:.4f}] '
+             f'/Resources << /XObject << '
+             + ' '.join(f'/M{index} {obj} 0 R' for index, obj in image_ids.items())
+             + ' >> >> /Contents 4 0 R >>').encode('ascii'),
+            b'<< /Length %d /Filter /FlateDecode >>\nstream\n' % len(content) + content + b'\nendstream',
+        ]
+        for index in image_ids:
+            module = self.modules[index]
+            data = zlib.compress(module.tobytes())
+            objects.append(
+                b'<< /Type /XObject /Subtype /Image /Width %d /Height %d '
+                b'/ColorSpace /DeviceGray /BitsPerComponent 8 /Filter /FlateDecode /Length %d >>\nstream\n'
+                % (module.width, module.height, len(data)) + data + b'\nendstream'
+            )
+
+        with open(output_path, 'wb') as f:
+            f.write(b'%PDF-1.4\n')
+            offsets = []
+            for number, body in enumerate(objects, 1):
+                offsets.append(f.tell())
+                f.write(b'%d 0 obj\n' % number + body + b'\nendobj\n')
+            xref = f.tell()
+            f.write(b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1))
+            for offset in offsets:
+                f.write(b'%010d 00000 n \n' % offset)
+            f.write(b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(objects) + 1, xref))
+
+    def generate(self, output_path='output.png', invert=False, md_folder=None, workers=None, dzi_folder=None,
+                 placement_path=None):
         """
         최종 이미지 생성
 
         Args:
-            output_path: 출력 파일 경로
+            output_path: 출력 파일 경로 (.svg / .pdf면 벡터 출력)
             invert: True면 명암 반전 (밝은 곳에 어두운 모듈)
             md_folder: 마크다운 파일을 저장할 폴더 (None이면 이미지와 같은 폴더)
+            workers: 밴드 합성에 사용할 스레드 수 (None이면 CPU 코어 수)
+            dzi_folder: Deep Zoom(DZI) 타일 피라미드를 저장할 폴더 (None이면 생성 안 함)
+            placement_path: 셀별 모듈 배치 맵(.npz)을 저장할 경로 (None이면 저장 안 함)
         """
+        if os.path.splitext(output_path)[1].lower() in VECTOR_EXTENSIONS:
+            return self.generate_vector(output_path, invert=invert, md_folder=md_folder, dzi_folder=dzi_folder,
+                                        placement_path=placement_path)
+
         print("🎨 최종 이미지 생성 중...")
 
-        # 사용 횟수 초기화
-        for name in self.module_usage_count:
-            self.module_usage_count[name] = 0
+        canvas = self._composite_raster(invert=invert, workers=workers)
+        if placement_path:
+            self.save_placement(placement_path, invert=invert)
+
+        return self._save_raster(output_path, canvas, md_folder=md_folder, dzi_folder=dzi_folder)
 
+    def _composite_raster(self, invert=False, workers=None, placement=None):
+        """
+        가로 밴드 단위로 모듈을 RGB 캔버스에 합성
+
+        Args:
+            invert: True면 명암 반전 (placement가 없을 때만 사용)
+            workers: 스레드 수 (None이면 CPU 코어 수)
+            placement: (rows, cols) 모듈 인덱스 배열. None이면 밴드마다 밝기 매칭
+
+        Returns:
+            (height, width, 3) uint8 캔버스
+        """
         cols, rows = self.grid_size
         module_size = self.modules[0].size[0]  # 모든 모듈이 같은 크기라고 가정
+        workers = workers or os.cpu_count() or 1
 
         # 최종 캔버스 생성
         final_width = cols * module_size
         final_height = rows * module_size
-        final_image = Image.new('RGB', (final_width, final_height), 'white')
+        canvas = np.empty((final_height, final_width, 3), dtype=np.uint8)
+        if placement is None:
+            matched = np.empty((rows, cols), dtype=np.intp)
+        else:
+            matched = placement
 
         print(f"  최종 크기: {final_width} x {final_height} 픽셀")
         print(f"  모듈 크기: {module_size} x {module_size} 픽셀")
 
-        # 각 그리드 셀에 모듈 배치
-        for row in range(rows):
-            for col in range(cols):
-                brightness = self.grid_brightness[row, col]
-
-                # 반전 옵션 적용
-                if invert:
-                    brightness = 255 - brightness
-
-                module = self.match_module(brightness)
-
-                # 모듈을 RGB로 변환하여 붙이기
-                module_rgb = module.convert('RGB')
-                x = col * module_size
-                y = row * module_size
-                final_image.paste(module_rgb, (x, y))
+        # 모듈을 RGB 배열로 한 번만 변환
+        module_stack = np.stack([np.asarray(module.convert('RGB')) for module in self.modules])
 
-            # 진행상황 표시
-            if (row + 1) % 10 == 0 or row == rows - 1:
-                progress = (row + 1) / rows * 100
-                print(f"  진행: {progress:.1f}% ({row + 1}/{rows} 행)")
+        def render_band(start, stop):
+            """[start, stop) 행을 매칭하고 캔버스의 해당 구간에 합성"""
+            if placement is None:
+                indices = self._match_brightness(self.grid_brightness[start:stop], invert)
+                matched[start:stop] = indices
+            else:
+                indices = placement[start:stop]
+            band = canvas[start * module_size:stop * module_size].reshape(
+                stop - start, module_size, cols, module_size, 3)
+            band[...] = module_stack[indices].transpose(0, 2, 1, 3, 4)
+            return stop - start, np.bincount(indices.ravel(), minlength=len(self.modules))
+
+        # 가로 밴드로 나눠 스레드 풀에서 병렬 합성 (NumPy 복사는 GIL을 해제함)
+        band_rows = max(1, -(-rows // (workers * 4)))
+        bands = [(start, min(start + band_rows, rows)) for start in range(0, rows, band_rows)]
+        counts = np.zeros(len(self.modules), dtype=np.int64)
+        done_rows = 0
+        next_report = 10
+
+        with ThreadPoolExecutor(max_workers=min(workers, len(bands))) as executor:
+            futures = [executor.submit(render_band, start, stop) for start, stop in bands]
+            for future in as_completed(futures):
+                band_size, band_counts = future.result()
+                counts += band_counts
+                done_rows += band_size
+
+                # 진행상황 표시
+                if done_rows >= next_report or done_rows == rows:
+                    progress = done_rows / rows * 100
+                    print(f"  진행: {progress:.1f}% ({done_rows}/{rows} 행)")
+                    next_report = (done_rows // 10 + 1) * 10
+
+        # 밴드별 사용 횟수 합산
+        self._set_usage(counts)
+        self.placement = matched
+
+        return canvas
+
+    def _set_usage(self, counts):
+        """모듈 인덱스별 사용 횟수 배열을 module_usage_count에 반영"""
+        for name, count in zip(self.module_names, counts):
+            self.module_usage_count[name] = int(count)
+
+    def _save_raster(self, output_path, canvas, md_folder=None, dzi_folder=None):
+        """합성된 캔버스를 저장하고 타일 피라미드/사용 통계 생성"""
+        final_height, final_width = canvas.shape[:2]
+        final_image = Image.fromarray(canvas, 'RGB')
 
         # 저장
         final_image.save(output_path, dpi=(self.output_dpi, self.output_dpi))
@@ -166,6 +520,294 @@ class ModuleGridGenerator:
         height_mm = (final_height / self.output_dpi) * 25.4
         print(f"   인쇄 크기: {width_mm:.1f} x {height_mm:.1f} mm ({self.output_dpi}dpi 기준)")
 
+        # 브라우저용 타일 피라미드
+        if dzi_folder:
+            base_name = os.path.splitext(os.path.basename(output_path))[0]
+            dzi_path = os.path.join(dzi_folder, base_name + '.dzi')
+            self.save_dzi(dzi_path, self.placement, canvas=canvas[..., 0])
+
+        self._save_usage_for(output_path, md_folder)
+
+        return final_image
+
+    def module_fingerprint(self):
+        """모듈 라이브러리 지문 (파일명, 순서, 픽셀 내용의 SHA-256)"""
+        digest = hashlib.sha256()
+        for name, module in zip(self.module_names, self.modules):
+            digest.update(name.encode('utf-8'))
+            digest.update(f"{module.mode}{module.size}".encode('ascii'))
+            digest.update(module.tobytes())
+        return digest.hexdigest()
+
+    def save_placement(self, placement_path, invert=False):
+        """
+        셀별 모듈 배치 맵 저장 (.npz)
+
+        uint16 모듈 인덱스 배열과 모듈 라이브러리 지문을 저장하므로,
+        이후 매칭 없이 render_from_placement로 다시 합성할 수 있다.
+        """
+        if len(self.modules) > np.iinfo(np.uint16).max + 1:
+            raise ValueError(f"배치 맵은 최대 {np.iinfo(np.uint16).max + 1}개 모듈까지 지원합니다: {len(self.modules)}개")
+
+        folder = os.path.dirname(os.path.abspath(placement_path))
+        os.makedirs(folder, exist_ok=True)
+        np.savez_compressed(
+            placement_path,
+            placement=self.placement.astype(np.uint16),
+            fingerprint=np.array(self.module_fingerprint()),
+            module_names=np.array(self.module_names),
+            invert=np.array(bool(invert)),
+            target=np.array(os.path.basename(self.target_image or '')),
+        )
+        print(f"🧩 배치 맵 저장됨: {placement_path}")
+
+    def render_from_placement(self, placement_path, output_path='output.png', md_folder=None, workers=None,
+                              dzi_folder=None):
+        """
+        저장된 배치 맵에서 바로 합성 (타겟 분석/매칭 생략)
+
+        DPI, 출력 형식만 바꿔 같은 디자인을 다시 만들 때 사용한다.
+        analyze_modules()는 먼저 호출되어 있어야 한다.
+
+        Args:
+            placement_path: save_placement로 저장한 .npz 경로
+            output_path: 출력 파일 경로 (.svg / .pdf면 벡터 출력)
+            md_folder: 마크다운 파일을 저장할 폴더 (None이면 출력 파일과 같은 폴더)
+            workers: 밴드 합성에 사용할 스레드 수 (None이면 CPU 코어 수)
+            dzi_folder: Deep Zoom 타일 피라미드를 저장할 폴더 (None이면 생성 안 함)
+        """
+        placement_map = load_placement(placement_path)
+        if placement_map['fingerprint'] != self.module_fingerprint():
+            raise ValueError(f"배치 맵의 모듈 라이브러리가 현재 모듈 폴더와 다릅니다: {self.module_folder}")
+
+        placement = placement_map['placement'].astype(np.intp)
+        rows, cols = placement.shape
+        self.grid_size = (cols, rows)
+
+        print(f"🎨 배치 맵에서 이미지 생성 중... ({placement_path})")
+
+        if os.path.splitext(output_path)[1].lower() in VECTOR_EXTENSIONS:
+            self._set_usage(np.bincount(placement.ravel(), minlength=len(self.modules)))
+            self.placement = placement
+            self._save_vector(output_path, placement, md_folder=md_folder, dzi_folder=dzi_folder)
+            return placement
+
+        canvas = self._composite_raster(placement=placement, workers=workers)
+        return self._save_raster(output_path, canvas, md_folder=md_folder, dzi_folder=dzi_folder)
+
+    def _composite_gray(self, placement, cell_size):
+        """모듈을 cell_size로 축소해 그레이스케일 캔버스에 합성"""
+        rows, cols = placement.shape
+        if cell_size == self.modules[0].size[0]:
+            tiles = np.stack([np.asarray(module) for module in self.modules])
+        else:
+            tiles = np.stack([
+                np.asarray(module.resize((cell_size, cell_size), Image.Resampling.BOX))
+                for module in self.modules
+            ])
+        canvas = tiles[placement].transpose(0, 2, 1, 3)
+        return canvas.reshape(rows * cell_size, cols * cell_size)
+
+    def save_dzi(self, dzi_path, placement, canvas=None, tile_size=254, overlap=1, tile_format='jpg'):
+        """
+        Deep Zoom(DZI) 타일 피라미드 저장
+
+        마스터 이미지를 다시 디코딩하지 않고, 각 레벨을 모듈 인덱스 그리드와
+        축소된 모듈로 직접 합성한다.
+
+        Args:
+            dzi_path: .dzi 파일 경로 (타일은 <이름>_files/<레벨>/<열>_<행>.<형식>)
+            placement: (rows, cols) 모듈 인덱스 배열
+            canvas: 최대 해상도 그레이스케일 캔버스 (있으면 최상위 레벨에 재사용)
+            tile_size: 타일 크기 (픽셀)
+            overlap: 타일 간 겹침 (픽셀)
+            tile_format: 'jpg' 또는 'png'
+        """
+        rows, cols = placement.shape
+        module_size = self.modules[0].size[0]
+        width = cols * module_size
+        height = rows * module_size
+        max_level = int(np.ceil(np.log2(max(width, height))))
+
+        tiles_folder = os.path.splitext(dzi_path)[0] + '_files'
+        os.makedirs(tiles_folder, exist_ok=True)
+        save_options = {'quality': 90} if tile_format == 'jpg' else {}
+        tile_count = 0
+
+        for level in range(max_level, -1, -1):
+            scale = 2.0 ** (level - max_level)
+            level_width = max(1, int(np.ceil(width * scale)))
+            level_height = max(1, int(np.ceil(height * scale)))
+
+            if level == max_level:
+                level_image = canvas if canvas is not None else self._composite_gray(placement, module_size)
+            else:
+                # 셀 하나가 1픽셀 미만이 되면 모듈 평균 밝기(1x1)로 합성 후 축소
+                cell_size = max(1, int(round(module_size * scale)))
+                level_image = self._composite_gray(placement, cell_size)
+                if level_image.shape != (level_height, level_width):
+                    level_image = np.asarray(
+                        Image.fromarray(level_image).resize((level_width, level_height), Image.Resampling.BOX))
+
+            level_folder = os.path.join(tiles_folder, str(level))
+            os.makedirs(level_folder, exist_ok=True)
+            for tile_row in range(int(np.ceil(level_height / tile_size))):
+                y0 = max(0, tile_row * tile_size - overlap)
+                y1 = min(level_height, (tile_row + 1) * tile_size + overlap)
+                for tile_col in range(int(np.ceil(level_width / tile_size))):
+                    x0 = max(0, tile_col * tile_size - overlap)
+                    x1 = min(level_width, (tile_col + 1) * tile_size + overlap)
+                    tile = Image.fromarray(np.ascontiguousarray(level_image[y0:y1, x0:x1]))
+                    tile.save(os.path.join(level_folder, f"{tile_col}_{tile_row}.{tile_format}"), **save_options)
+                    tile_count += 1
+
+        with open(dzi_path, 'w', encoding='utf-8') as f:
+            f.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+            f.write(f'<Image xmlns="http://schemas.microsoft.com/deepzoom/2008" Format="{tile_format}" '
+                    f'Overlap="{overlap}" TileSize="{tile_size}">\n')
+            f.write(f'  <Size Width="{width}" Height="{height}"/>\n')
+            f.write('</Image>\n')
+
+        print(f"🗺️  타일 피라미드 저장됨: {dzi_path} (레벨 {max_level + 1}개, 타일 {tile_count}개)")
+
+    def generate_sequence(self, frame_paths, output_path, invert=False, duration=100, md_folder=None):
+        """
+        프레임 시퀀스 생성 - 이전 프레임과 모듈이 달라진 셀만 다시 합성
+
+        Args:
+            frame_paths: 순서대로 정렬된 프레임 이미지 경로 목록
+            output_path: .gif / .webp면 애니메이션 파일, 그 외에는 번호 붙은 PNG를 저장할 폴더
+            invert: True면 명암 반전
+            duration: 애니메이션 프레임 간격 (ms)
+            md_folder: 마크다운 파일을 저장할 폴더 (None이면 출력 경로 옆)
+
+        Returns:
+            프레임별 변경된 셀 개수 목록
+        """
+        print("🎞️  프레임 시퀀스 생성 중...")
+
+        if not frame_paths:
+            raise FileNotFoundError("프레임 이미지가 없습니다.")
+
+        # 그리드 크기는 첫 프레임 기준
+        if self.grid_size is None:
+            self.target_image = str(frame_paths[0])
+            self.prepare_target_image()
+
+        cols, rows = self.grid_size
+        module_size = self.modules[0].size[0]
+        tiles = np.stack([np.asarray(module) for module in self.modules])
+
+        animated = os.path.splitext(output_path)[1].lower() in ('.gif', '.webp')
+        if not animated:
+            os.makedirs(output_path, exist_ok=True)
+
+        print(f"  프레임: {len(frame_paths)}개, 그리드: {cols} x {rows}")
+        print(f"  프레임 크기: {cols * module_size} x {rows * module_size} 픽셀")
+
+        canvas = None
+        previous = None
+        frames = []
+        changed_counts = []
+        counts = np.zeros(len(self.modules), dtype=np.int64)
+
+        for number, frame_path in enumerate(frame_paths, 1):
+            with Image.open(frame_path) as frame:
+                resized = frame.convert('L').resize((cols, rows), Image.Resampling.LANCZOS)
+            placement = self._match_brightness(np.array(resized), invert)
+            counts += np.bincount(placement.ravel(), minlength=len(self.modules))
+
+            if canvas is None:
+                canvas = self._composite_gray(placement, module_size).copy()
+                changed = rows * cols
+            else:
+                # 바뀐 셀만 다시 붙이기
+                changed_rows, changed_cols = np.nonzero(placement != previous)
+                cells = canvas.reshape(rows, module_size, cols, module_size)
+                cells[changed_rows, :, changed_cols, :] = tiles[placement[changed_rows, changed_cols]]
+                changed = len(changed_rows)
+            previous = placement
+            changed_counts.append(changed)
+
+            if animated:
+                frames.append(Image.fromarray(canvas.copy(), 'L'))
+            else:
+                frame_file = os.path.join(output_path, f"frame_{number:05d}.png")
+                Image.fromarray(canvas, 'L').save(frame_file, dpi=(self.output_dpi, self.output_dpi))
+
+            print(f"  프레임 {number}/{len(frame_paths)}: 변경된 셀 {changed}개 ({changed / (rows * cols) * 100:.1f}%)")
+
+        # 애니메이션 저장 (GIF/WebP 인코더는 전체 프레임이 필요)
+        if animated:
+            frames[0].save(output_path, save_all=True, append_images=frames[1:], duration=duration, loop=0)
+
+        self._set_usage(counts)
+        self.placement = previous
+
+        print(f"\n✅ 완료! 저장됨: {output_path}")
+        print(f"   프레임: {len(frame_paths)}개")
+        print(f"   다시 합성한 셀: {sum(changed_counts[1:])}개 / {rows * cols * (len(frame_paths) - 1)}개 (첫 프레임 제외)")
+
+        self._save_usage_for(output_path.rstrip('/\\'), md_folder)
+
+        return changed_counts
+
+    def generate_vector(self, output_path='output.svg', invert=False, md_folder=None, dzi_folder=None,
+                        placement_path=None):
+        """
+        벡터(SVG/PDF) 출력 생성 - 모듈은 한 번만 포함하고 셀은 참조로 배치
+
+        Args:
+            output_path: 출력 파일 경로 (.svg 또는 .pdf)
+            invert: True면 명암 반전
+            md_folder: 마크다운 파일을 저장할 폴더 (None이면 출력 파일과 같은 폴더)
+            dzi_folder: Deep Zoom 타일 피라미드를 저장할 폴더 (None이면 생성 안 함)
+            placement_path: 셀별 모듈 배치 맵(.npz)을 저장할 경로 (None이면 저장 안 함)
+
+        Returns:
+            (rows, cols) 모듈 인덱스 배열
+        """
+        print("🎨 벡터 출력 생성 중...")
+
+        placement = self.build_placement(invert=invert)
+        if placement_path:
+            self.save_placement(placement_path, invert=invert)
+
+        self._save_vector(output_path, placement, md_folder=md_folder, dzi_folder=dzi_folder)
+
+        return placement
+
+    def _save_vector(self, output_path, placement, md_folder=None, dzi_folder=None):
+        """배치 맵을 SVG/PDF로 저장하고 타일 피라미드/사용 통계 생성"""
+        rows, cols = placement.shape
+        module_size = self.modules[0].size[0]
+
+        ext = os.path.splitext(output_path)[1].lower()
+        if ext == '.svg':
+            self.save_svg(output_path, placement)
+        elif ext == '.pdf':
+            self.save_pdf(output_path, placement)
+        else:
+            raise ValueError(f"지원하지 않는 벡터 형식입니다: {ext}")
+
+        file_size = os.path.getsize(output_path) / (1024 * 1024)
+        width_mm = (cols * module_size / self.output_dpi) * 25.4
+        height_mm = (rows * module_size / self.output_dpi) * 25.4
+
+        print(f"\n✅ 완료! 저장됨: {output_path}")
+        print(f"   그리드: {cols} x {rows} (셀 {cols * rows}개)")
+        print(f"   포함된 모듈: {len(np.unique(placement))}개")
+        print(f"   파일 크기: {file_size:.2f} MB")
+        print(f"   인쇄 크기: {width_mm:.1f} x {height_mm:.1f} mm ({self.output_dpi}dpi 기준)")
+
+        if dzi_folder:
+            base_name = os.path.splitext(os.path.basename(output_path))[0]
+            self.save_dzi(os.path.join(dzi_folder, base_name + '.dzi'), placement)
+
+        self._save_usage_for(output_path, md_folder)
+
+    def _save_usage_for(self, output_path, md_folder=None):
+        """출력 파일에 대응하는 사용 통계 마크다운 저장"""
         # 모듈 사용 횟수를 마크다운 파일로 저장
         if md_folder:
             os.makedirs(md_folder, exist_ok=True)
@@ -176,8 +818,6 @@ class ModuleGridGenerator:
 
         self.save_usage_stats(usage_file, output_path)
 
-        return final_image
-
     def save_usage_stats(self, usage_file, output_image_path, copy_images=False):
         """모듈 사용 통계를 마크다운 파일로 저장
 
@@ -290,7 +930,439 @@ class ModuleGridGenerator:
         print(f"📊 사용 통계 저장됨: {usage_file}")
 
 
-def process_folder(module_folder, target_folder, output_folder, grid_size=None, output_dpi=300, invert=False, md_folder=None, copy_images=False):
+class ModuleAtlas:
+    """
+    디코딩된 모듈 타일을 하나의 연속 배열로 묶은 아틀라스
+
+    (N, 높이, 너비) uint8 배열을 ATLAS_FOLDER에 .npy로 저장하고 읽기 전용 메모리 맵으로 연다.
+    파일 이름이 라이브러리 내용 해시이므로 gunicorn 워커, 렌더 프로세스가 같은 페이지를 공유한다.
+    (--preload 마스터에서 미리 load하면 포크된 워커는 디코딩 없이 바로 사용)
+    """
+
+    _loaded = {}  # 프로세스 내 캐시: (모듈 폴더 절대 경로, 타일 크기, 맞춤 방식) -> (파일 상태, ModuleAtlas)
+    _lock = threading.Lock()
+
+    def __init__(self, key, tiles, names, brightness):
+        self.key = key
+        self.tiles = tiles  # 밝기 순으로 정렬된 (N, h, w) 배열
+        self.names = names
+        self.brightness = brightness
+        self.path = os.path.join(ATLAS_FOLDER, key + '.npy')
+
+    def images(self):
+        """타일을 복사 없이 감싼 PIL 이미지 목록"""
+        height, width = self.tiles.shape[1:]
+        return [Image.frombuffer('L', (width, height), tile, 'raw', 'L', 0, 1) for tile in self.tiles]
+
+    @staticmethod
+    def _file_state(module_files):
+        """파일명/크기/수정 시각으로 만든 변경 감지용 상태"""
+        return tuple((f.name, f.stat().st_size, f.stat().st_mtime_ns) for f in module_files)
+
+    @staticmethod
+    def _library_key(module_files, tile_size, fit):
+        """라이브러리 내용 해시 (업로드 폴더가 바뀌어도 같은 모듈이면 같은 키)"""
+        digest = hashlib.sha256(f"{tile_size}:{fit}".encode('ascii'))
+        for module_file in module_files:
+            digest.update(module_file.name.encode('utf-8'))
+            digest.update(module_file.read_bytes())
+        return digest.hexdigest()[:32]
+
+    @classmethod
+    def load(cls, module_folder, tile_size=None, fit='crop'):
+        """모듈 폴더의 아틀라스를 반환 (프로세스 캐시 → 디스크 아틀라스 → 새로 빌드 순)
+
+        tile_size, fit은 analyze_modules와 같다 (크기가 다른 모듈은 정규화해서 묶음).
+        """
+        module_folder = os.path.abspath(module_folder)
+        module_files = find_module_files(module_folder)
+        if not module_files:
+            raise FileNotFoundError(f"모듈 폴더에서 이미지를 찾을 수 없습니다: {module_folder}")
+
+        state = cls._file_state(module_files)
+        with cls._lock:
+            cached = cls._loaded.get((module_folder, tile_size, fit))
+            if cached and cached[0] == state:
+                return cached[1]
+
+            # 이미 지워진 폴더(웹 요청별 업로드 폴더 등)의 항목은 버림
+            for stale in [loaded for loaded in cls._loaded if not os.path.isdir(loaded[0])]:
+                del cls._loaded[stale]
+
+        # 해시 계산/빌드는 잠금 밖에서 (다른 라이브러리 로드가 기다리지 않도록,
+        # 같은 라이브러리를 동시에 빌드해도 임시 파일 + 교체라서 안전)
+        key = cls._library_key(module_files, tile_size, fit)
+        atlas = cls._open(key) or cls._build(key, module_files, tile_size, fit)
+
+        with cls._lock:
+            cls._loaded[(module_folder, tile_size, fit)] = (state, atlas)
+        return atlas
+
+    @classmethod
+    def _open(cls, key):
+        """디스크 아틀라스를 읽기 전용 메모리 맵으로 열기 (없으면 None)"""
+        tiles_path = os.path.join(ATLAS_FOLDER, key + '.npy')
+        meta_path = os.path.join(ATLAS_FOLDER, key + '.json')
+        if not (os.path.exists(tiles_path) and os.path.exists(meta_path)):
+            return None
+
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        tiles = np.load(tiles_path, mmap_mode='r')
+
+        # 사용 시각 갱신 (캐시 정리 시 최근에 쓴 아틀라스는 남김)
+        try:
+            os.utime(tiles_path)
+        except OSError:
+            pass
+        return cls(key, tiles, meta['names'], meta['brightness'])
+
+    @classmethod
+    def _build(cls, key, module_files, tile_size=None, fit='crop'):
+        """모듈을 디코딩해 아틀라스 파일을 만들고 메모리 맵으로 다시 열기"""
+        tiles = load_module_tiles(module_files, tile_size=tile_size, fit=fit)
+        brightness = [float(tile.mean()) for tile in tiles]
+
+        # 밝기 순으로 정렬 (어두운 것 -> 밝은 것)
+        order = np.argsort(brightness)
+        meta = {
+            'names': [module_files[i].name for i in order],
+            'brightness': [brightness[i] for i in order],
+        }
+
+        # 임시 파일에 쓴 뒤 교체 (동시에 빌드하는 다른 워커와 충돌하지 않도록)
+        os.makedirs(ATLAS_FOLDER, exist_ok=True)
+        suffix = f".{os.getpid()}.{threading.get_ident()}.tmp"
+        tiles_path = os.path.join(ATLAS_FOLDER, key + '.npy')
+        meta_path = os.path.join(ATLAS_FOLDER, key + '.json')
+        with open(meta_path + suffix, 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        with open(tiles_path + suffix, 'wb') as f:
+            np.save(f, np.stack([tiles[i] for i in order]))
+        os.replace(meta_path + suffix, meta_path)
+        os.replace(tiles_path + suffix, tiles_path)
+
+        print(f"🗂️  모듈 아틀라스 생성됨: {tiles_path}")
+        prune_cache_folder(ATLAS_FOLDER, ATLAS_MAX_BYTES, keep=(key,))
+        return cls._open(key)
+
+    @classmethod
+    def invalidate(cls, module_folder=None, remove_files=False):
+        """
+        프로세스 캐시에서 아틀라스 제거 (라이브러리가 바뀌었을 때)
+
+        Args:
+            module_folder: 제거할 모듈 폴더 (None이면 전체)
+            remove_files: True면 디스크 아틀라스 파일도 삭제
+                          (이미 매핑한 다른 프로세스는 계속 기존 내용을 읽음)
+        """
+        with cls._lock:
+            if module_folder is None:
+                removed = [entry[1] for entry in cls._loaded.values()]
+                cls._loaded.clear()
+            else:
+                module_folder = os.path.abspath(module_folder)
+                keys = [key for key in cls._loaded if key[0] == module_folder]
+                removed = [cls._loaded.pop(key)[1] for key in keys]
+
+        if remove_files:
+            for atlas in removed:
+                for path in (atlas.path, os.path.splitext(atlas.path)[0] + '.json'):
+                    if os.path.exists(path):
+                        os.remove(path)
+
+    @classmethod
+    def refresh(cls, module_folder, tile_size=None, fit='crop'):
+        """아틀라스를 버리고 모듈 폴더에서 다시 빌드"""
+        cls.invalidate(module_folder, remove_files=True)
+        return cls.load(module_folder, tile_size=tile_size, fit=fit)
+
+
+# 지원하는 이미지 확장자
+IMAGE_EXTENSIONS = ['.png', '.jpg', '.jpeg', '.bmp', '.gif', '.tiff', '.webp']
+
+
+def ssim(a, b, window=7):
+    """두 그레이스케일 배열의 평균 SSIM (적분 영상으로 만든 박스 윈도우, 벡터화)"""
+    c1 = (0.01 * 255) ** 2
+    c2 = (0.03 * 255) ** 2
+
+    def box_mean(x):
+        integral = np.pad(x, ((1, 0), (1, 0))).cumsum(axis=0).cumsum(axis=1)
+        total = (integral[window:, window:] - integral[:-window, window:]
+                 - integral[window:, :-window] + integral[:-window, :-window])
+        return total / (window * window)
+
+    mean_a = box_mean(a)
+    mean_b = box_mean(b)
+    var_a = box_mean(a * a) - mean_a ** 2
+    var_b = box_mean(b * b) - mean_b ** 2
+    covariance = box_mean(a * b) - mean_a * mean_b
+
+    ssim_map = ((2 * mean_a * mean_b + c1) * (2 * covariance + c2)) / \
+               ((mean_a ** 2 + mean_b ** 2 + c1) * (var_a + var_b + c2))
+    return float(ssim_map.mean())
+
+
+def multiscale_ssim(a, b, levels=4):
+    """해상도를 절반씩 줄여 가며 계산한 SSIM의 평균 (가장 작은 해상도는 윈도우보다 커야 함)"""
+    scores = []
+    for _ in range(levels):
+        scores.append(ssim(a, b))
+        height, width = (a.shape[0] // 2) * 2, (a.shape[1] // 2) * 2
+        if min(height, width) // 2 < 8:
+            break
+        a = a[:height, :width].reshape(height // 2, 2, width // 2, 2).mean(axis=(1, 3))
+        b = b[:height, :width].reshape(height // 2, 2, width // 2, 2).mean(axis=(1, 3))
+    return float(np.mean(scores))
+
+
+def probe_image(source):
+    """
+    이미지 헤더만 읽어 (형식, 너비, 높이) 반환 - 픽셀은 디코딩하지 않음
+
+    Args:
+        source: 파일 경로 또는 읽기 가능한 스트림 (스트림 위치는 호출한 쪽에서 되돌려야 함)
+    """
+    with Image.open(source) as img:
+        return img.format, img.width, img.height
+
+
+def prune_cache_folder(folder, max_bytes, keep=()):
+    """
+    캐시 폴더가 max_bytes를 넘으면 가장 오래 쓰지 않은 항목부터 삭제 (LRU, 수정 시각 기준)
+
+    같은 이름의 .npy/.json 파일은 한 항목으로 취급한다. 이미 메모리 맵으로 연 프로세스는
+    삭제 후에도 기존 내용을 계속 읽을 수 있다.
+
+    Args:
+        folder: 캐시 폴더
+        max_bytes: 남길 최대 크기
+        keep: 삭제하지 않을 항목 이름(확장자 제외) 목록
+
+    Returns:
+        삭제한 항목 수
+    """
+    if not os.path.isdir(folder):
+        return 0
+
+    entries = {}  # 항목 이름 -> [크기 합, 최근 수정 시각, 파일 경로 목록]
+    for entry in os.scandir(folder):
+        stem, ext = os.path.splitext(entry.name)
+        if ext not in ('.npy', '.json') or not entry.is_file():
+            continue
+        try:
+            stat = entry.stat()
+        except FileNotFoundError:
+            continue
+        item = entries.setdefault(stem, [0, 0.0, []])
+        item[0] += stat.st_size
+        item[1] = max(item[1], stat.st_mtime)
+        item[2].append(entry.path)
+
+    total = sum(item[0] for item in entries.values())
+    removed = 0
+    for stem, (size, _, paths) in sorted(entries.items(), key=lambda entry: entry[1][1]):
+        if total <= max_bytes:
+            break
+        if stem in keep:
+            continue
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        total -= size
+        removed += 1
+
+    if removed:
+        print(f"🧹 캐시 정리: {folder} ({removed}개 삭제)")
+    return removed
+
+
+def dzi_preview_tile(dzi_path):
+    """
+    DZI 피라미드에서 타일 한 장에 다 들어가는 가장 큰 레벨의 타일 경로 (미리보기용 썸네일)
+
+    Returns:
+        .dzi 파일 폴더 기준 상대 경로 (<이름>_files/<레벨>/0_0.<형식>)
+    """
+    root = ET.parse(dzi_path).getroot()
+    size = root.find('{http://schemas.microsoft.com/deepzoom/2008}Size')
+    width, height = int(size.get('Width')), int(size.get('Height'))
+    tile_size = int(root.get('TileSize'))
+
+    max_level = int(np.ceil(np.log2(max(width, height))))
+    level = max_level
+    while level > 0 and max(width, height) * 2.0 ** (level - max_level) > tile_size:
+        level -= 1
+
+    base_name = os.path.splitext(os.path.basename(dzi_path))[0]
+    return f"{base_name}_files/{level}/0_0.{root.get('Format')}"
+
+
+def find_module_files(folder):
+    """모듈 폴더에서 PNG/JPG 모듈 파일을 찾아 이름순으로 반환"""
+    module_files = list(Path(folder).glob('*.png'))
+    module_files.extend(Path(folder).glob('*.jpg'))
+    module_files.extend(Path(folder).glob('*.jpeg'))
+    return sorted(module_files)
+
+
+def normalize_module(img, tile_size, fit='crop'):
+    """모듈 이미지(그레이스케일)를 tile_size x tile_size 정사각형으로 맞춤"""
+    if fit not in MODULE_FIT_POLICIES:
+        raise ValueError(f"지원하지 않는 맞춤 방식입니다: {fit} ({', '.join(MODULE_FIT_POLICIES)})")
+
+    width, height = img.size
+    if fit == 'stretch':
+        return img.resize((tile_size, tile_size), Image.Resampling.LANCZOS)
+
+    # crop은 짧은 변, pad는 긴 변을 tile_size에 맞춤
+    scale = tile_size / (min(width, height) if fit == 'crop' else max(width, height))
+    new_size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    resized = img.resize(new_size, Image.Resampling.LANCZOS) if new_size != img.size else img
+
+    if fit == 'crop':
+        left = (new_size[0] - tile_size) // 2
+        top = (new_size[1] - tile_size) // 2
+        return resized.crop((left, top, left + tile_size, top + tile_size))
+
+    tile = Image.new('L', (tile_size, tile_size), 255)
+    tile.paste(resized, ((tile_size - new_size[0]) // 2, (tile_size - new_size[1]) // 2))
+    return tile
+
+
+_normalized_tiles = OrderedDict()  # 프로세스 내 정규화 타일 LRU 캐시: 캐시 키 -> 배열
+_normalized_tiles_lock = threading.Lock()
+
+
+def load_module_tiles(module_files, tile_size=None, fit='crop'):
+    """
+    모듈 파일들을 그레이스케일 배열로 읽기
+
+    크기가 모두 같은 정사각형이면 그대로 디코딩하고, 다르면 공통 타일 크기로 정규화한다.
+    정규화 결과는 원본 내용 해시 + 타일 크기 + 맞춤 방식을 키로 TILE_CACHE_FOLDER와
+    프로세스 메모리에 캐시하므로, 같은 라이브러리는 리샘플링 비용을 한 번만 낸다.
+    (메모리는 최근 TILE_MEMORY_CACHE_SIZE개, 폴더는 TILE_CACHE_MAX_BYTES까지만 유지)
+
+    Args:
+        module_files: 모듈 파일 경로 목록
+        tile_size: 타일 크기 (None이면 모두 같을 때는 그대로, 다르면 짧은 변의 중앙값)
+        fit: 맞춤 방식 ('crop', 'pad', 'stretch')
+
+    Returns:
+        파일 순서대로 (tile_size, tile_size) uint8 배열 목록
+    """
+    if fit not in MODULE_FIT_POLICIES:
+        raise ValueError(f"지원하지 않는 맞춤 방식입니다: {fit} ({', '.join(MODULE_FIT_POLICIES)})")
+
+    # 헤더만 읽어 크기 확인
+    sizes = [probe_image(module_file)[1:] for module_file in module_files]
+    if tile_size is None:
+        if len(set(sizes)) == 1 and sizes[0][0] == sizes[0][1]:
+            return [np.array(Image.open(module_file).convert('L')) for module_file in module_files]
+        tile_size = int(np.median([min(size) for size in sizes]))
+
+    tiles = []
+    resampled = 0
+    for module_file, size in zip(module_files, sizes):
+        if size == (tile_size, tile_size):
+            tiles.append(np.array(Image.open(module_file).convert('L')))
+            continue
+
+        data = Path(module_file).read_bytes()
+        key = f"{hashlib.sha256(data).hexdigest()[:32]}_{tile_size}_{fit}"
+        with _normalized_tiles_lock:
+            tile = _normalized_tiles.get(key)
+            if tile is not None:
+                _normalized_tiles.move_to_end(key)
+        if tile is None:
+            cache_path = os.path.join(TILE_CACHE_FOLDER, key + '.npy')
+            if os.path.exists(cache_path):
+                tile = np.load(cache_path)
+                try:
+                    os.utime(cache_path)  # 사용 시각 갱신 (폴더 정리 시 남김)
+                except OSError:
+                    pass
+            else:
+                img = Image.open(BytesIO(data)).convert('L')
+                tile = np.array(normalize_module(img, tile_size, fit))
+
+                # 임시 파일에 쓴 뒤 교체 (동시에 정규화하는 다른 워커와 충돌하지 않도록)
+                os.makedirs(TILE_CACHE_FOLDER, exist_ok=True)
+                temp_path = f"{cache_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                with open(temp_path, 'wb') as f:
+                    np.save(f, tile)
+                os.replace(temp_path, cache_path)
+                resampled += 1
+            with _normalized_tiles_lock:
+                _normalized_tiles[key] = tile
+                while len(_normalized_tiles) > TILE_MEMORY_CACHE_SIZE:
+                    _normalized_tiles.popitem(last=False)
+        tiles.append(tile)
+
+    if resampled:
+        prune_cache_folder(TILE_CACHE_FOLDER, TILE_CACHE_MAX_BYTES)
+    print(f"  모듈 타일 크기: {tile_size} x {tile_size} ({fit}, 새로 정규화 {resampled}개)")
+    return tiles
+
+
+def find_images(folder):
+    """폴더에서 지원하는 이미지 파일을 찾아 이름순으로 반환"""
+    image_files = []
+    for ext in IMAGE_EXTENSIONS:
+        image_files.extend(Path(folder).glob(f'*{ext}'))
+        image_files.extend(Path(folder).glob(f'*{ext.upper()}'))
+
+    return sorted(set(image_files))
+
+
+def process_target(generator, target_file, output_folder, invert=False, md_folder=None, copy_images=False,
+                   output_format=None, dzi_folder=None, placement_folder=None, workers=None):
+    """
+    타겟 이미지 한 장 처리 (분석된 생성기 재사용)
+
+    workers는 generate와 같다 (여러 타겟을 동시에 처리할 때는 1로 지정).
+
+    Returns:
+        dict: total.md에 쓰일 처리 결과 정보
+    """
+    target_file = Path(target_file)
+
+    # 타겟 이미지 업데이트
+    generator.target_image = str(target_file)
+    generator.prepare_target_image()
+
+    # 출력 파일명 생성
+    suffix = f".{output_format.lstrip('.')}" if output_format else target_file.suffix
+    output_filename = f"{target_file.stem}_grid{suffix}"
+    output_path = os.path.join(output_folder, output_filename)
+
+    # 생성
+    placement_path = None
+    if placement_folder:
+        placement_path = os.path.join(placement_folder, f"{target_file.stem}_grid_placement.npz")
+    generator.generate(output_path, invert=invert, md_folder=md_folder, workers=workers, dzi_folder=dzi_folder,
+                       placement_path=placement_path)
+
+    # copy_images 옵션 적용 (개별 MD 파일에)
+    base_name = os.path.splitext(output_filename)[0]
+    if copy_images:
+        # 이미지 복사하여 재생성
+        individual_md = os.path.join(md_folder, base_name + '_usage.md')
+        generator.save_usage_stats(individual_md, output_path, copy_images=True)
+
+    return {
+        'name': target_file.name,
+        'output': output_filename,
+        'output_path': output_path,
+        'md_file': base_name + '_usage.md',
+        'usage_count': dict(generator.module_usage_count)
+    }
+
+
+def process_folder(module_folder, target_folder, output_folder, grid_size=None, output_dpi=300, invert=False, md_folder=None, copy_images=False, output_format=None, dzi_folder=None, placement_folder=None, use_atlas=False, max_output_pixels=None, max_file_mb=None, tile_size=None, module_fit='crop'):
     """
     폴더 내 모든 이미지를 일괄 처리
 
@@ -303,22 +1375,18 @@ def process_folder(module_folder, target_folder, output_folder, grid_size=None,
         invert: 명암 반전 여부
         md_folder: 마크다운 파일을 저장할 폴더 (None이면 output_folder/md)
         copy_images: True면 이미지를 md 폴더에 복사 (전달용)
+        output_format: 출력 확장자 (예: 'svg', 'pdf'). None이면 타겟과 같은 확장자
+        dzi_folder: Deep Zoom 타일 피라미드를 저장할 폴더 (None이면 생성 안 함)
+        placement_folder: 셀별 모듈 배치 맵(.npz)을 저장할 폴더 (None이면 저장 안 함)
+        use_atlas: True면 공유 모듈 아틀라스(ModuleAtlas) 사용
+        max_output_pixels, max_file_mb: grid_size='auto'일 때 그리드 탐색 예산
+        tile_size, module_fit: 크기가 다른 모듈의 정규화 (analyze_modules의 tile_size, fit)
     """
-    from pathlib import Path
-
     # 출력 폴더 생성
     os.makedirs(output_folder, exist_ok=True)
 
-    # 지원하는 이미지 확장자
-    image_extensions = ['.png', '.jpg', '.jpeg', '.bmp', '.gif', '.tiff', '.webp']
-
     # 타겟 폴더에서 이미지 파일 찾기
-    target_files = []
-    for ext in image_extensions:
-        target_files.extend(Path(target_folder).glob(f'*{ext}'))
-        target_files.extend(Path(target_folder).glob(f'*{ext.upper()}'))
-
-    target_files = sorted(set(target_files))
+    target_files = find_images(target_folder)
 
     if not target_files:
         print(f"❌ 타겟 폴더에서 이미지를 찾을 수 없습니다: {target_folder}")
@@ -342,9 +1410,11 @@ def process_folder(module_folder, target_folder, output_folder, grid_size=None,
         module_folder=module_folder,
         target_image=str(target_files[0]),  # 임시로 첫 번째 이미지 사용
         grid_size=grid_size,
-        output_dpi=output_dpi
+        output_dpi=output_dpi,
+        max_output_pixels=max_output_pixels,
+        max_file_mb=max_file_mb
     )
-    generator.analyze_modules()
+    generator.analyze_modules(use_atlas=use_atlas, tile_size=tile_size, fit=module_fit)
 
     # 전체 파일의 모듈 사용 통계 합산
     total_usage_count = {name: 0 for name in generator.module_names}
@@ -359,40 +1429,20 @@ def process_folder(module_folder, target_folder, output_folder, grid_size=None,
             print(f"\n[{idx}/{len(target_files)}] 처리 중: {target_file.name}")
             print("-" * 60)
 
-            # 타겟 이미지 업데이트
-            generator.target_image = str(target_file)
-            generator.prepare_target_image()
-
-            # 출력 파일명 생성
-            output_filename = f"{target_file.stem}_grid{target_file.suffix}"
-            output_path = os.path.join(output_folder, output_filename)
-
-            # 생성
-            generator.generate(output_path, invert=invert, md_folder=md_folder)
-
-            # copy_images 옵션 적용 (개별 MD 파일에)
-            if copy_images:
-                # MD 파일 경로 계산
-                base_name = os.path.splitext(os.path.basename(output_path))[0]
-                individual_md = os.path.join(md_folder, base_name + '_usage.md')
-                # 이미지 복사하여 재생성
-                generator.save_usage_stats(individual_md, output_path, copy_images=True)
+            file_info = process_target(
+                generator, target_file, output_folder, invert=invert, md_folder=md_folder,
+                copy_images=copy_images, output_format=output_format, dzi_folder=dzi_folder,
+                placement_folder=placement_folder
+            )
 
             success_count += 1
 
             # 전체 통계에 합산
-            for module_name, count in generator.module_usage_count.items():
+            for module_name, count in file_info['usage_count'].items():
                 total_usage_count[module_name] += count
 
             # 처리된 파일 정보 저장 (MD 파일 경로 포함)
-            base_name = os.path.splitext(output_filename)[0]
-            processed_files.append({
-                'name': target_file.name,
-                'output': output_filename,
-                'output_path': output_path,
-                'md_file': base_name + '_usage.md',
-                'usage_count': dict(generator.module_usage_count)
-            })
+            processed_files.append(file_info)
 
         except Exception as e:
             print(f"❌ 오류 발생: {e}")
@@ -415,6 +1465,366 @@ def process_folder(module_folder, target_folder, output_folder, grid_size=None,
     print()
 
 
+def load_placement(placement_path):
+    """
+    save_placement로 저장한 배치 맵 읽기
+
+    Returns:
+        dict: placement (uint16 배열), fingerprint, module_names, invert, target
+    """
+    with np.load(placement_path, allow_pickle=False) as data:
+        return {
+            'placement': data['placement'],
+            'fingerprint': str(data['fingerprint']),
+            'module_names': [str(name) for name in data['module_names']],
+            'invert': bool(data['invert']),
+            'target': str(data['target']),
+        }
+
+
+def placement_usage(placement_map):
+    """배치 맵에서 모듈별 사용 횟수 계산 (이미지 데이터 없이)"""
+    if isinstance(placement_map, (str, os.PathLike)):
+        placement_map = load_placement(placement_map)
+
+    names = placement_map['module_names']
+    counts = np.bincount(placement_map['placement'].ravel(), minlength=len(names))
+    return {name: int(count) for name, count in zip(names, counts)}
+
+
+def diff_placements(old_map, new_map):
+    """
+    두 배치 맵 비교 - 셀마다 모듈 파일명이 달라졌는지 확인
+
+    Returns:
+        dict: changed_cells, total_cells, changed_ratio, changed_mask, usage_delta
+    """
+    if isinstance(old_map, (str, os.PathLike)):
+        old_map = load_placement(old_map)
+    if isinstance(new_map, (str, os.PathLike)):
+        new_map = load_placement(new_map)
+
+    if old_map['placement'].shape != new_map['placement'].shape:
+        raise ValueError(f"그리드 크기가 다릅니다: {old_map['placement'].shape} vs {new_map['placement'].shape}")
+
+    # 모듈 라이브러리가 달라도 파일명 기준으로 비교
+    if old_map['module_names'] == new_map['module_names']:
+        changed_mask = old_map['placement'] != new_map['placement']
+    else:
+        old_names = np.array(old_map['module_names'])[old_map['placement']]
+        new_names = np.array(new_map['module_names'])[new_map['placement']]
+        changed_mask = old_names != new_names
+
+    old_usage = placement_usage(old_map)
+    new_usage = placement_usage(new_map)
+    usage_delta = {
+        name: new_usage.get(name, 0) - old_usage.get(name, 0)
+        for name in sorted(set(old_usage) | set(new_usage))
+    }
+
+    changed_cells = int(changed_mask.sum())
+    return {
+        'changed_cells': changed_cells,
+        'total_cells': changed_mask.size,
+        'changed_ratio': changed_cells / changed_mask.size,
+        'changed_mask': changed_mask,
+        'usage_delta': usage_delta,
+    }
+
+
+def watch_folder(module_folder, target_folder, output_folder, grid_size=None, output_dpi=300, invert=False,
+                 md_folder=None, copy_images=False, output_format=None, dzi_folder=None, placement_folder=None,
+                 use_atlas=False, max_output_pixels=None, max_file_mb=None, tile_size=None, module_fit='crop',
+                 interval=2.0, workers=2, max_pending=None, max_polls=None):
+    """
+    핫 폴더 감시 - 새로 들어오거나 바뀐 타겟 이미지를 계속 처리
+
+    모듈 분석은 시작할 때 한 번만 하고, 타겟 폴더를 주기적으로 폴링한다.
+    파일 상태(수정 시각, 크기)가 두 번 연속 같을 때만 처리하므로 복사 중인 파일은 기다린다.
+    처리는 제한된 스레드 풀에서 하며, 대기 작업이 가득 차면 폴링을 멈춰 기다린다 (백프레셔).
+    total.md는 결과가 하나 끝날 때마다 갱신된다.
+
+    Args:
+        module_folder ~ module_fit: process_folder와 같음
+        interval: 폴링 간격 (초)
+        workers: 동시에 렌더링할 작업 수
+        max_pending: 실행 중 외에 대기시킬 최대 작업 수 (None이면 workers와 같음)
+        max_polls: 폴링 횟수 제한 (None이면 Ctrl+C까지 계속 감시)
+    """
+    import time
+
+    os.makedirs(output_folder, exist_ok=True)
+    if md_folder is None:
+        md_folder = os.path.join(output_folder, 'md')
+    os.makedirs(md_folder, exist_ok=True)
+    total_md_path = os.path.join(md_folder, 'total.md')
+
+    print("=" * 60)
+    print(f"👀 폴더 감시 시작")
+    print("=" * 60)
+    print(f"타겟 폴더: {target_folder}")
+    print(f"출력 폴더: {output_folder}")
+    print(f"폴링 간격: {interval}초, 동시 작업: {workers}개")
+    print()
+
+    # 모듈 분석은 한 번만 (메모리에 유지)
+    generator = ModuleGridGenerator(
+        module_folder=module_folder,
+        target_image=None,
+        grid_size=grid_size,
+        output_dpi=output_dpi,
+        max_output_pixels=max_output_pixels,
+        max_file_mb=max_file_mb
+    )
+    generator.analyze_modules(use_atlas=use_atlas, tile_size=tile_size, fit=module_fit)
+
+    seen = {}  # 경로 -> 직전 폴링의 (수정 시각, 크기)
+    done = {}  # 경로 -> 처리한 시점의 (수정 시각, 크기)
+    in_flight = set()
+    results = {}  # 타겟 파일명 -> 처리 결과 정보 (다시 처리되면 교체)
+    lock = threading.Lock()
+    slots = threading.BoundedSemaphore(workers + (workers if max_pending is None else max_pending))
+
+    def render(path, state):
+        """타겟 한 장을 처리하고 total.md 갱신"""
+        try:
+            file_info = process_target(
+                generator.copy_for_target(str(path)), path, output_folder, invert=invert, md_folder=md_folder,
+                copy_images=copy_images, output_format=output_format, dzi_folder=dzi_folder,
+                placement_folder=placement_folder, workers=1  # 병렬화는 작업 단위로만 (스레드 과다 방지)
+            )
+            with lock:
+                results[file_info['name']] = file_info
+                processed_files = [results[name] for name in sorted(results)]
+                total_usage_count = {name: 0 for name in generator.module_names}
+                for info in processed_files:
+                    for module_name, count in info['usage_count'].items():
+                        total_usage_count[module_name] += count
+                save_total_stats(total_md_path, total_usage_count, processed_files,
+                                 module_folder, generator.module_names, copy_images)
+        except Exception as e:
+            print(f"❌ 오류 발생: {path.name}: {e}")
+        finally:
+            with lock:
+                done[path] = state
+                in_flight.discard(path)
+            slots.release()
+
+    polls = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        try:
+            while max_polls is None or polls < max_polls:
+                polls += 1
+                paths = find_images(target_folder)
+                for path in paths:
+                    try:
+                        stat = path.stat()
+                    except FileNotFoundError:
+                        continue
+                    state = (stat.st_mtime_ns, stat.st_size)
+
+                    with lock:
+                        if done.get(path) == state or path in in_flight:
+                            continue
+
+                    # 직전 폴링과 상태가 같아야 처리 (아직 쓰는 중인 파일 제외)
+                    if seen.get(path) != state:
+                        seen[path] = state
+                        continue
+
+                    slots.acquire()  # 대기 작업이 가득 차면 여기서 기다림
+                    with lock:
+                        in_flight.add(path)
+                    print(f"\n📥 새 타겟 감지: {path.name}")
+                    executor.submit(render, path, state)
+
+                # 지워진 타겟의 상태는 버림 (같은 이름으로 다시 들어오면 새로 처리)
+                current = set(paths)
+                with lock:
+                    for path in [path for path in seen if path not in current]:
+                        del seen[path]
+                    for path in [path for path in done if path not in current and path not in in_flight]:
+                        del done[path]
+
+                if max_polls is None or polls < max_polls:
+                    time.sleep(interval)
+        except KeyboardInterrupt:
+            print("\n⏹️  감시 중지 - 진행 중인 작업을 마무리합니다...")
+
+    print(f"\n📊 감시 종료: {len(results)}개 결과, 통계: {total_md_path}")
+    return results
+
+
+def sweep_folder(module_folders, target_folder, output_folder, grid_sizes=(None,), inverts=(False,), output_dpi=300,
+                 output_format=None, workers=None, use_atlas=False, max_output_pixels=None, max_file_mb=None,
+                 tile_size=None, module_fit='crop'):
+    """
+    여러 모듈 라이브러리 x 그리드 크기 x 명암 반전 조합으로 같은 타겟들을 렌더링하고 비교 리포트 작성
+
+    타겟은 한 번만 디코딩하고 그리드 크기마다 한 번만 리사이즈해 모든 조합이 공유한다.
+    그리드 크기 결정('auto' 탐색 포함), 매칭, 합성은 조합 x 타겟 단위로 스레드 풀에서 병렬 처리하며,
+    타겟 하나나 조합 하나가 실패해도 나머지는 계속 진행한다.
+
+    Args:
+        module_folders: 모듈 이미지 폴더 목록
+        target_folder: 타겟 이미지 폴더
+        output_folder: 결과 폴더 (조합마다 하위 폴더, 리포트는 sweep.md)
+        grid_sizes: 그리드 크기 목록 ((cols, rows), None, 'auto')
+        inverts: 명암 반전 값 목록 (예: (False, True))
+        output_dpi: 출력 DPI
+        output_format: 출력 확장자 (None이면 타겟과 같은 확장자)
+        workers: 동시 렌더링 작업 수 (None이면 CPU 코어 수)
+        use_atlas: True면 공유 모듈 아틀라스(ModuleAtlas) 사용
+        max_output_pixels, max_file_mb: 'auto' 그리드 탐색 예산
+        tile_size, module_fit: 크기가 다른 모듈의 정규화 (analyze_modules의 tile_size, fit)
+
+    Returns:
+        조합별 결과 정보 목록
+    """
+    target_files = find_images(target_folder)
+    if not target_files:
+        print(f"❌ 타겟 폴더에서 이미지를 찾을 수 없습니다: {target_folder}")
+        return []
+
+    os.makedirs(output_folder, exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+
+    # 같은 그리드/반전 값이 여러 번 주어지면 한 번만 렌더링
+    grid_sizes = list(dict.fromkeys(grid_sizes))
+    inverts = list(dict.fromkeys(inverts))
+
+    print("=" * 60)
+    print(f"🔀 스윕 렌더링 시작")
+    print("=" * 60)
+    print(f"모듈 라이브러리: {len(module_folders)}개, 그리드: {len(grid_sizes)}개, 반전: {len(inverts)}개")
+    print(f"타겟: {len(target_files)}개 → 렌더링 {len(module_folders) * len(grid_sizes) * len(inverts) * len(target_files)}건")
+    print()
+
+    # 라이브러리마다 모듈 분석은 한 번만
+    libraries = []
+    for module_folder in module_folders:
+        generator = ModuleGridGenerator(module_folder=module_folder, target_image=None, output_dpi=output_dpi)
+        generator.analyze_modules(use_atlas=use_atlas, tile_size=tile_size, fit=module_fit)
+        libraries.append(generator)
+
+    # 타겟은 한 번만 디코딩 (읽을 수 없는 타겟은 실패로 세고 건너뜀)
+    targets = {}
+    fail_count = 0
+    for target_file in target_files:
+        try:
+            with Image.open(target_file) as img:
+                targets[target_file] = img.convert('L')
+        except Exception as e:
+            print(f"❌ 타겟을 읽을 수 없습니다: {target_file.name}: {e}")
+            fail_count += len(libraries) * len(grid_sizes) * len(inverts)
+
+    # 라이브러리 이름 (폴더 이름이 겹치면 순번을 붙여 조합 폴더/리포트가 섞이지 않게 함)
+    base_names = [os.path.basename(os.path.normpath(library.module_folder)) for library in libraries]
+    library_names = [name if base_names.count(name) == 1 else f"{name}_{index}"
+                     for index, name in enumerate(base_names, 1)]
+
+    combos = []
+    jobs = []
+
+    for library, library_name in zip(libraries, library_names):
+        for grid_spec in grid_sizes:
+            for invert in inverts:
+                grid_label = grid_spec if isinstance(grid_spec, str) else (
+                    f"{grid_spec[0]}x{grid_spec[1]}" if grid_spec else 'default')
+                label = f"{library_name}_{grid_label}_{'invert' if invert else 'normal'}"
+                combo = {
+                    'label': label,
+                    'module_folder': library.module_folder,
+                    'grid': grid_label,
+                    'invert': invert,
+                    'results': [],
+                }
+                combos.append(combo)
+                combo_folder = os.path.join(output_folder, label)
+                os.makedirs(combo_folder, exist_ok=True)
+
+                for target_file in targets:
+                    suffix = f".{output_format.lstrip('.')}" if output_format else target_file.suffix
+                    output_path = os.path.join(combo_folder, f"{target_file.stem}_grid{suffix}")
+                    jobs.append((combo, library, grid_spec, target_file, output_path, invert))
+
+    lock = threading.Lock()
+    resized_cache = {}  # (타겟, (cols, rows)) -> 그리드 밝기 배열
+    pending = {target_file: 0 for target_file in targets}  # 타겟별 그리드를 아직 만들지 않은 작업 수
+    for job in jobs:
+        pending[job[3]] += 1
+
+    def build_grid(library, grid_spec, target_file, invert):
+        """조합의 그리드 크기를 정하고 타겟 그리드 밝기 준비 (같은 타겟/그리드 크기는 공유)"""
+        try:
+            with lock:
+                target = targets[target_file]
+            generator = library.copy_for_target(str(target_file))
+            generator.auto_grid = grid_spec == 'auto'
+            generator.grid_size = None if generator.auto_grid else grid_spec
+            generator.max_output_pixels = max_output_pixels
+            generator.max_file_mb = max_file_mb
+            grid_size = generator.resolve_grid_size(target, invert=invert)
+
+            key = (target_file, grid_size)
+            with lock:
+                grid = resized_cache.get(key)
+            if grid is None:
+                grid = np.array(target.resize(grid_size, Image.Resampling.LANCZOS))
+                with lock:
+                    grid = resized_cache.setdefault(key, grid)
+            generator.grid_brightness = grid
+            return generator
+        finally:
+            # 타겟의 모든 조합이 그리드를 만들었으면 디코딩한 타겟과 캐시 해제
+            with lock:
+                pending[target_file] -= 1
+                if pending[target_file] == 0:
+                    del targets[target_file]
+                    for key in [key for key in resized_cache if key[0] == target_file]:
+                        del resized_cache[key]
+
+    def render(combo, library, grid_spec, target_file, output_path, invert):
+        """조합 하나의 타겟 한 장 매칭/렌더링"""
+        generator = build_grid(library, grid_spec, target_file, invert)
+        generator.generate(output_path, invert=invert, md_folder=os.path.join(output_folder, 'md', combo['label']),
+                           workers=1)
+        cols, rows = generator.grid_size
+        return {
+            'name': target_file.name,
+            'output_path': output_path,
+            'grid': f"{cols}x{rows}",
+            'usage_count': dict(generator.module_usage_count),
+        }
+
+    success_count = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(render, *job): job for job in jobs}
+        for future in as_completed(futures):
+            combo, _, _, target_file, _, _ = futures[future]
+            try:
+                combo['results'].append(future.result())
+                success_count += 1
+            except Exception as e:
+                print(f"❌ 오류 발생: {combo['label']} / {target_file.name}: {e}")
+                fail_count += 1
+
+    for combo in combos:
+        combo['results'].sort(key=lambda result: result['name'])
+
+    # 실패한 조합/타겟도 리포트에 (실패)로 표시
+    save_sweep_stats(os.path.join(output_folder, 'sweep.md'), combos, [f.name for f in target_files])
+
+    print("\n" + "=" * 60)
+    print("📊 스윕 렌더링 완료")
+    print("=" * 60)
+    print(f"성공: {success_count}개")
+    print(f"실패: {fail_count}개")
+    print(f"출력 폴더: {output_folder}")
+    print()
+    return combos
+
+
 def save_total_stats(total_md_path, total_usage_count, processed_files, module_folder, module_names, copy_images=False):
     """전체 파일의 모듈 사용 통계를 저장"""
     output_dir = os.path.dirname(os.path.abspath(total_md_path))
@@ -521,21 +1931,204 @@ def save_total_stats(total_md_path, total_usage_count, processed_files, module_f
     print(f"📊 전체 통계 저장됨: {total_md_path}")
 
 
-def main():
+def save_sweep_stats(sweep_md_path, combos, target_names):
+    """스윕 결과를 조합별로 비교하는 리포트 저장"""
+    output_dir = os.path.dirname(os.path.abspath(sweep_md_path))
+
+    with open(sweep_md_path, 'w', encoding='utf-8') as f:
+        f.write("# 스윕 비교 리포트\n\n")
+        f.write(f"- **조합 수**: {len(combos)}\n")
+        f.write(f"- **타겟 수**: {len(target_names)}\n\n")
+
+        f.write("---\n\n")
+        f.write("## 조합 목록\n\n")
+        f.write("| 조합 | 모듈 폴더 | 그리드 | 명암 반전 | 성공 |\n")
+        f.write("|:---|:---|:---:|:---:|---:|\n")
+        for combo in combos:
+            invert = '예' if combo['invert'] else '아니오'
+            f.write(f"| {combo['label']} | {combo['module_folder']} | {combo['grid']} | {invert} | "
+                    f"{len(combo['results'])}/{len(target_names)} |\n")
+
+        f.write("\n---\n\n")
+        f.write("## 타겟별 비교\n\n")
+
+        for target_name in target_names:
+            f.write(f"### {target_name}\n\n")
+            f.write("| 조합 | 결과 이미지 | 그리드 | 가장 많이 사용된 모듈 |\n")
+            f.write("|:---|:---:|:---:|:---|\n")
+            for combo in combos:
+                result = next((r for r in combo['results'] if r['name'] == target_name), None)
+                if result is None:
+                    f.write(f"| {combo['label']} | (실패) | - | - |\n")
+                    continue
+
+                try:
+                    result_path = os.path.relpath(result['output_path'], output_dir)
+                except ValueError:
+                    result_path = result['output_path']
+
+                total = sum(result['usage_count'].values())
+                top_name, top_count = max(result['usage_count'].items(), key=lambda x: x[1])
+                percentage = (top_count / total * 100) if total > 0 else 0
+                f.write(f"| {combo['label']} | ![{combo['label']}]({result_path}) | {result['grid']} | "
+                        f"{top_name} ({percentage:.1f}%) |\n")
+            f.write("\n")
+
+    print(f"📊 스윕 리포트 저장됨: {sweep_md_path}")
+
+
+def parse_grid(text):
+    """'50x70' 형식의 그리드 문자열 파싱 ('auto'는 품질 기반 탐색, 잘못된 형식이면 None → 자동 계산)"""
+    if not text:
+        return None
+    if text == 'auto':
+        return 'auto'
+    try:
+        cols, rows = map(int, text.split('x'))
+        return (cols, rows)
+    except:
+        print(f"⚠️  잘못된 그리드 형식: {text}. 자동 계산됩니다.")
+        return None
+
+
+def main_sweep(argv):
+    """sweep 서브커맨드: 여러 라이브러리/설정 비교 렌더링"""
+    import argparse
+
+    parser = argparse.ArgumentParser(prog='module_grid_generator.py sweep', description='여러 모듈 라이브러리 비교 렌더링')
+    parser.add_argument('--modules', '-m', nargs='+', required=True, help='모듈 이미지 폴더 경로 (여러 개)')
+    parser.add_argument('--target-folder', '-tf', required=True, help='타겟 이미지 폴더')
+    parser.add_argument('--output-folder', '-of', default='./sweep_output', help='출력 폴더 경로')
+    parser.add_argument('--grid', '-g', nargs='+', default=[None], help='그리드 크기 (여러 개, 예: 50x70 80x112 auto)')
+    parser.add_argument('--invert', '-i', choices=['off', 'on', 'both'], default='off', help='명암 반전 (both면 둘 다)')
+    parser.add_argument('--dpi', '-d', type=int, default=300, help='출력 DPI (기본: 300)')
+    parser.add_argument('--format', '-f', choices=['png', 'jpg', 'svg', 'pdf'], default=None, help='출력 형식')
+    parser.add_argument('--workers', '-w', type=int, default=None, help='동시 렌더링 작업 수 (기본: CPU 코어 수)')
+    parser.add_argument('--max-pixels', type=int, default=None, help='--grid auto 탐색 시 결과 최대 픽셀 수')
+    parser.add_argument('--max-mb', type=float, default=None, help='--grid auto 탐색 시 결과 최대 크기 MB (비압축)')
+    parser.add_argument('--tile-size', type=int, default=None, help='모듈 타일 크기 (크기가 다른 모듈 정규화, 기본: 짧은 변 중앙값)')
+    parser.add_argument('--fit', choices=MODULE_FIT_POLICIES, default='crop', help='크기가 다른 모듈 맞춤 방식 (기본: crop)')
+
+    args = parser.parse_args(argv)
+
+    inverts = {'off': (False,), 'on': (True,), 'both': (False, True)}[args.invert]
+    sweep_folder(
+        module_folders=args.modules,
+        target_folder=args.target_folder,
+        output_folder=args.output_folder,
+        grid_sizes=[parse_grid(grid) for grid in args.grid],
+        inverts=inverts,
+        output_dpi=args.dpi,
+        output_format=args.format,
+        workers=args.workers,
+        max_output_pixels=args.max_pixels,
+        max_file_mb=args.max_mb,
+        tile_size=args.tile_size,
+        module_fit=args.fit
+    )
+
+
+def main_watch(argv):
+    """watch 서브커맨드: 핫 폴더 감시"""
+    import argparse
+
+    parser = argparse.ArgumentParser(prog='module_grid_generator.py watch', description='타겟 폴더 감시 모드')
+    parser.add_argument('--modules', '-m', required=True, help='모듈 이미지 폴더 경로')
+    parser.add_argument('--target-folder', '-tf', required=True, help='감시할 타겟 이미지 폴더')
+    parser.add_argument('--output-folder', '-of', default='./output_folder', help='출력 폴더 경로')
+    parser.add_argument('--grid', '-g', help='그리드 크기 (예: 50x70, auto면 품질 기반 탐색)', default=None)
+    parser.add_argument('--max-pixels', type=int, default=None, help='--grid auto 탐색 시 결과 최대 픽셀 수')
+    parser.add_argument('--max-mb', type=float, default=None, help='--grid auto 탐색 시 결과 최대 크기 MB (비압축)')
+    parser.add_argument('--tile-size', type=int, default=None, help='모듈 타일 크기 (크기가 다른 모듈 정규화, 기본: 짧은 변 중앙값)')
+    parser.add_argument('--fit', choices=MODULE_FIT_POLICIES, default='crop', help='크기가 다른 모듈 맞춤 방식 (기본: crop)')
+    parser.add_argument('--dpi', '-d', type=int, default=300, help='출력 DPI (기본: 300)')
+    parser.add_argument('--invert', '-i', action='store_true', help='명암 반전')
+    parser.add_argument('--format', '-f', choices=['png', 'jpg', 'svg', 'pdf'], default=None, help='출력 형식')
+    parser.add_argument('--interval', type=float, default=2.0, help='폴링 간격 초 (기본: 2)')
+    parser.add_argument('--workers', '-w', type=int, default=2, help='동시 렌더링 작업 수 (기본: 2)')
+    parser.add_argument('--max-pending', type=int, default=None, help='대기 작업 최대 수 (기본: workers와 같음)')
+
+    args = parser.parse_args(argv)
+
+    watch_folder(
+        module_folder=args.modules,
+        target_folder=args.target_folder,
+        output_folder=args.output_folder,
+        grid_size=parse_grid(args.grid),
+        output_dpi=args.dpi,
+        invert=args.invert,
+        output_format=args.format,
+        max_output_pixels=args.max_pixels,
+        max_file_mb=args.max_mb,
+        tile_size=args.tile_size,
+        module_fit=args.fit,
+        interval=args.interval,
+        workers=args.workers,
+        max_pending=args.max_pending
+    )
+
+
+def main(argv=None):
     """사용 예시"""
     import argparse
 
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] == 'watch':
+        return main_watch(argv[1:])
+    if argv and argv[0] == 'sweep':
+        return main_sweep(argv[1:])
+
     parser = argparse.ArgumentParser(description='모듈 그리드 생성기')
     parser.add_argument('--modules', '-m', required=True, help='모듈 이미지 폴더 경로')
     parser.add_argument('--target', '-t', help='타겟 이미지 경로 또는 폴더 경로')
     parser.add_argument('--target-folder', '-tf', help='타겟 이미지 폴더 경로 (일괄 처리)')
     parser.add_argument('--output', '-o', default='output.png', help='출력 파일 경로')
     parser.add_argument('--output-folder', '-of', help='출력 폴더 경로 (일괄 처리용)')
-    parser.add_argument('--grid', '-g', help='그리드 크기 (예: 50x70)', default=None)
+    parser.add_argument('--grid', '-g', help='그리드 크기 (예: 50x70, auto면 품질 기반 탐색)', default=None)
+    parser.add_argument('--max-pixels', type=int, default=None, help='--grid auto 탐색 시 결과 최대 픽셀 수')
+    parser.add_argument('--max-mb', type=float, default=None, help='--grid auto 탐색 시 결과 최대 크기 MB (비압축)')
+    parser.add_argument('--tile-size', type=int, default=None, help='모듈 타일 크기 (크기가 다른 모듈 정규화, 기본: 짧은 변 중앙값)')
+    parser.add_argument('--fit', choices=MODULE_FIT_POLICIES, default='crop', help='크기가 다른 모듈 맞춤 방식 (기본: crop)')
     parser.add_argument('--dpi', '-d', type=int, default=300, help='출력 DPI (기본: 300)')
     parser.add_argument('--invert', '-i', action='store_true', help='명암 반전')
+    parser.add_argument('--dzi', help='Deep Zoom 타일 피라미드를 저장할 폴더')
+    parser.add_argument('--placement', '-p', help='배치 맵 저장 경로 (단일: .npz 파일, 일괄: 폴더)')
+    parser.add_argument('--from-placement', help='저장된 배치 맵에서 바로 합성 (.npz)')
+    parser.add_argument('--frames', help='프레임 이미지 폴더 (시퀀스 모드, 출력은 .gif/.webp 또는 폴더)')
+    parser.add_argument('--frame-duration', type=int, default=100, help='애니메이션 프레임 간격 ms (기본: 100)')
+    parser.add_argument('--format', '-f', choices=['png', 'jpg', 'svg', 'pdf'], default=None,
+                        help='일괄 처리 출력 형식 (svg/pdf는 벡터 출력)')
+
+    args = parser.parse_args(argv)
+
+    # 배치 맵 재합성 모드 (타겟 분석/매칭 생략)
+    if args.from_placement:
+        generator = ModuleGridGenerator(
+            module_folder=args.modules,
+            target_image=args.target,
+            output_dpi=args.dpi
+        )
+        generator.analyze_modules(tile_size=args.tile_size, fit=args.fit)
+        generator.render_from_placement(args.from_placement, args.output, dzi_folder=args.dzi)
+        return
+
+    # 그리드 크기 파싱
+    grid_size = parse_grid(args.grid)
 
-    args = parser.parse_args()
+    # 프레임 시퀀스 모드
+    if args.frames:
+        frame_paths = find_images(args.frames)
+        generator = ModuleGridGenerator(
+            module_folder=args.modules,
+            target_image=None,
+            grid_size=grid_size,
+            output_dpi=args.dpi,
+            max_output_pixels=args.max_pixels,
+            max_file_mb=args.max_mb
+        )
+        generator.analyze_modules(tile_size=args.tile_size, fit=args.fit)
+        generator.generate_sequence(frame_paths, args.output, invert=args.invert, duration=args.frame_duration)
+        return
 
     # 폴더 일괄 처리 모드
     if args.target_folder or args.output_folder:
@@ -545,22 +2138,20 @@ def main():
 
         output_folder = args.output_folder or './output_folder'
 
-        # 그리드 크기 파싱
-        grid_size = None
-        if args.grid:
-            try:
-                cols, rows = map(int, args.grid.split('x'))
-                grid_size = (cols, rows)
-            except:
-                print(f"⚠️  잘못된 그리드 형식: {args.grid}. 자동 계산됩니다.")
-
         process_folder(
             module_folder=args.modules,
             target_folder=args.target_folder,
             output_folder=output_folder,
             grid_size=grid_size,
             output_dpi=args.dpi,
-            invert=args.invert
+            max_output_pixels=args.max_pixels,
+            max_file_mb=args.max_mb,
+            tile_size=args.tile_size,
+            module_fit=args.fit,
+            invert=args.invert,
+            output_format=args.format,
+            dzi_folder=args.dzi,
+            placement_folder=args.placement
         )
         return
 
@@ -569,26 +2160,19 @@ def main():
         print("❌ 오류: --target (-t) 또는 --target-folder (-tf) 옵션이 필요합니다.")
         return
 
-    # 그리드 크기 파싱
-    grid_size = None
-    if args.grid:
-        try:
-            cols, rows = map(int, args.grid.split('x'))
-            grid_size = (cols, rows)
-        except:
-            print(f"⚠️  잘못된 그리드 형식: {args.grid}. 자동 계산됩니다.")
-
     # 생성기 실행
     generator = ModuleGridGenerator(
         module_folder=args.modules,
         target_image=args.target,
         grid_size=grid_size,
-        output_dpi=args.dpi
+        output_dpi=args.dpi,
+        max_output_pixels=args.max_pixels,
+        max_file_mb=args.max_mb
     )
 
-    generator.analyze_modules()
+    generator.analyze_modules(tile_size=args.tile_size, fit=args.fit)
     generator.prepare_target_image()
-    generator.generate(args.output, invert=args.invert)
+    generator.generate(args.output, invert=args.invert, dzi_folder=args.dzi, placement_path=args.placement)
 
 
 if __name__ == "__main__":
@@ -599,8 +2183,6 @@ if __name__ == "__main__":
     print()
 
     # 명령행 인자가 있으면 그것 사용, 없으면 기본값
-    import sys
-
     if len(sys.argv) > 1:
         main()
     else:
@@ -622,6 +2204,20 @@ if __name__ == "__main__":
         print("      --grid 50x70 \\")
         print("      --dpi 300")
         print()
+        print("폴더 감시 (새 타겟이 들어오면 자동 처리):")
+        print("  python module_grid_generator.py watch \\")
+        print("      --modules ./modules \\")
+        print("      --target-folder ./inbox \\")
+        print("      --output-folder ./results \\")
+        print("      --workers 2")
+        print()
+        print("여러 모듈 라이브러리 비교 (리포트: sweep.md):")
+        print("  python module_grid_generator.py sweep \\")
+        print("      --modules ./modules_a ./modules_b \\")
+        print("      --target-folder ./images \\")
+        print("      --output-folder ./sweep \\")
+        print("      --grid 50x70 80x112 --invert both")
+        print()
         print("간단한 사용:")
         print("  python module_grid_generator.py -m ./modules -t ./horse.jpg -o result.png")
         print("  python module_grid_generator.py -m ./modules -tf ./images -of ./results")
@@ -632,7 +2228,21 @@ if __name__ == "__main__":
         print("  --target-folder, -tf : 타겟 이미지 폴더 (일괄 처리)")
         print("  --output, -o       : 출력 파일명 (기본: output.png)")
         print("  --output-folder, -of : 출력 폴더 (일괄 처리)")
-        print("  --grid, -g         : 그리드 크기 (예: 50x70, 생략시 자동)")
+        print("  --grid, -g         : 그리드 크기 (예: 50x70, 생략시 자동, auto면 품질 기반 탐색)")
+        print("  --max-pixels       : --grid auto 탐색 시 결과 최대 픽셀 수")
+        print("  --max-mb           : --grid auto 탐색 시 결과 최대 크기 MB (비압축)")
+        print("  --tile-size        : 모듈 타일 크기 (크기가 다른 모듈 정규화)")
+        print("  --fit              : 크기가 다른 모듈 맞춤 방식 (crop/pad/stretch, 기본: crop)")
         print("  --dpi, -d          : 출력 DPI (기본: 300)")
         print("  --invert, -i       : 명암 반전")
+        print("  --format, -f       : 일괄 처리 출력 형식 (png/jpg/svg/pdf)")
+        print("  --dzi              : Deep Zoom 타일 피라미드 저장 폴더")
+        print("  --placement, -p    : 배치 맵 저장 (단일: .npz 파일, 일괄: 폴더)")
+        print("  --from-placement   : 저장된 배치 맵에서 바로 합성 (예: -m ./modules --from-placement a.npz -o a.pdf -d 600)")
+        print("  --frames           : 프레임 폴더 → 애니메이션 (예: -m ./modules --frames ./clip -o clip.gif)")
+        print("  --frame-duration   : 애니메이션 프레임 간격 ms (기본: 100)")
+        print()
+        print("벡터 출력 (모듈을 한 번만 포함, 셀은 참조로 배치):")
+        print("  python module_grid_generator.py -m ./modules -t ./horse.jpg -o result.svg")
+        print("  python module_grid_generator.py -m ./modules -t ./horse.jpg -o result.pdf")
         print()
\ No newline at end of file
@@ -11,21 +11,176 @@ import tempfile
 import shutil
 from pathlib import Path
 import base64
+import re
+import time
+import uuid
 from io import BytesIO
-from PIL import Image
+from PIL import Image, UnidentifiedImageError
 import numpy as np
 
-from module_grid_generator import ModuleGridGenerator, process_folder
+from module_grid_generator import ModuleGridGenerator, ModuleAtlas, process_folder, probe_image, dzi_preview_tile
 
 app = Flask(__name__)
 app.config['MAX_CONTENT_LENGTH'] = 500 * 1024 * 1024  # 500MB max
 app.config['UPLOAD_FOLDER'] = tempfile.mkdtemp()
+app.config['TILE_CACHE_MAX_AGE'] = 365 * 24 * 60 * 60  # 타일 URL은 실행마다 달라지므로 장기 캐시
+app.config['RUN_MAX_AGE'] = 60 * 60  # 요청별 작업 폴더 보관 시간 (초)
+
+# 업로드 허용 한도 (헤더만 읽어 디코딩 전에 판단)
+app.config['MAX_TARGET_PIXELS'] = 100 * 1000 * 1000  # 타겟 이미지 한 장 (디컴프레션 밤 방지)
+app.config['MAX_MODULE_PIXELS'] = 4096 * 4096  # 모듈 이미지 한 장
+app.config['MAX_OUTPUT_PIXELS'] = 400 * 1000 * 1000  # 결과 캔버스 한 장
+app.config['DOWNGRADE_OVERSIZED'] = True  # 결과가 너무 크면 거절 대신 그리드를 줄여 미리보기로 생성
+app.config['MAX_PREVIEW_PIXELS'] = 16 * 1000 * 1000  # 축소할 때의 미리보기 캔버스 크기
+app.config['MAX_RENDER_MEMORY_MB'] = int(os.environ.get('MAX_RENDER_MEMORY_MB', 384))  # 렌더링 한 건의 메모리 예산
+
+# PIL 자체 디컴프레션 밤 보호도 같은 한도로 맞춤
+Image.MAX_IMAGE_PIXELS = app.config['MAX_TARGET_PIXELS']
 
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'bmp', 'gif', 'tiff', 'webp'}
 
+# 자주 쓰는 모듈 라이브러리를 미리 아틀라스로 로드 (gunicorn --preload 시 마스터에서 한 번만 디코딩)
+for preload_folder in filter(None, os.environ.get('MODULE_ATLAS_PRELOAD', '').split(os.pathsep)):
+    ModuleAtlas.load(preload_folder)
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def runs_root():
+    """요청별 작업 폴더들의 상위 폴더 (워커끼리 UPLOAD_FOLDER를 공유해도 요청끼리 겹치지 않음)"""
+    return os.path.join(app.config['UPLOAD_FOLDER'], 'runs')
+
+def run_folder(run_id):
+    """run_id의 작업 폴더 경로 (형식이 잘못됐거나 없으면 None)"""
+    if not run_id or not re.fullmatch(r'[0-9a-f]{32}', run_id):
+        return None
+    folder = os.path.join(runs_root(), run_id)
+    return folder if os.path.isdir(folder) else None
+
+def cleanup_runs():
+    """보관 시간이 지난 작업 폴더 삭제"""
+    root = runs_root()
+    if not os.path.isdir(root):
+        return
+    expire_before = time.time() - app.config['RUN_MAX_AGE']
+    for entry in os.scandir(root):
+        try:
+            if entry.is_dir() and entry.stat().st_mtime < expire_before:
+                shutil.rmtree(entry.path, ignore_errors=True)
+        except FileNotFoundError:
+            continue
+
+def probe_uploads(files, max_pixels, kind):
+    """
+    업로드 파일들의 헤더만 읽어 크기 확인
+
+    Returns:
+        (probes, error) - probes는 (파일명, 형식, 너비, 높이) 목록, error는 (메시지, 상태 코드) 또는 None
+    """
+    probes = []
+    for file in files:
+        if not (file and allowed_file(file.filename)):
+            continue
+        try:
+            image_format, width, height = probe_image(file.stream)
+        except Image.DecompressionBombError:
+            return probes, (f'{kind} 이미지가 너무 큽니다: {file.filename} (최대 {max_pixels:,} 픽셀)', 413)
+        except (UnidentifiedImageError, OSError):
+            return probes, (f'{kind} 파일을 읽을 수 없습니다: {file.filename}', 400)
+        finally:
+            file.stream.seek(0)
+
+        if width * height > max_pixels:
+            return probes, (f'{kind} 이미지가 너무 큽니다: {file.filename} '
+                            f'({width}x{height}, 최대 {max_pixels:,} 픽셀)', 413)
+        probes.append((file.filename, image_format, width, height))
+    return probes, None
+
+def admit_generate(module_files, target_files, grid_size):
+    """
+    디코딩 전에 예상 결과 크기/메모리를 계산해 요청을 허용, 축소 또는 거절
+
+    Returns:
+        (grid_size, admission, error) - error가 있으면 (메시지, 상태 코드)
+    """
+    module_probes, error = probe_uploads(module_files, app.config['MAX_MODULE_PIXELS'], '모듈')
+    if error:
+        return grid_size, None, error
+    target_probes, error = probe_uploads(target_files, app.config['MAX_TARGET_PIXELS'], '타겟')
+    if error:
+        return grid_size, None, error
+    if not module_probes:
+        return grid_size, None, ('유효한 모듈 이미지가 없습니다.', 400)
+    if not target_probes:
+        return grid_size, None, ('유효한 타겟 이미지가 없습니다.', 400)
+
+    # 모듈 크기는 가장 큰 모듈 기준 (보수적으로 계산)
+    module_size = max(max(width, height) for _, _, width, height in module_probes)
+    largest_target = max(width * height for _, _, width, height in target_probes)
+
+    # 고정 비용: 모듈 라이브러리(합성용 RGB 스택 + 그레이스케일 사본) + 가장 큰 타겟 그레이스케일 디코딩
+    library_bytes = len(module_probes) * module_size * module_size * 4
+    fixed_bytes = library_bytes + largest_target
+    memory_budget = app.config['MAX_RENDER_MEMORY_MB'] * 1024 * 1024
+    max_output = app.config['MAX_OUTPUT_PIXELS']
+
+    # 남은 예산으로 만들 수 있는 결과 RGB 캔버스 크기
+    allowed_output = min(max_output, max(0, memory_budget - fixed_bytes) // 3)
+    if allowed_output < 100 * module_size * module_size:
+        return grid_size, {
+            'requested_grid': grid_size if grid_size == 'auto' else f'{grid_size[0]}x{grid_size[1]}',
+            'module_size': module_size,
+            'library_memory_mb': round(library_bytes / (1024 * 1024), 1),
+        }, (f'모듈 라이브러리가 너무 큽니다: {len(module_probes)}개 x {module_size}x{module_size} 픽셀 '
+            f'(메모리 예산 {app.config["MAX_RENDER_MEMORY_MB"]}MB)', 413)
+
+    # 자동 탐색은 생성기가 예산(max_output_pixels) 안에서 그리드를 고름
+    if grid_size == 'auto':
+        return grid_size, {
+            'requested_grid': 'auto',
+            'module_size': module_size,
+            'max_output_pixels': allowed_output,
+            'projected_pixels': allowed_output,
+            'library_memory_mb': round(library_bytes / (1024 * 1024), 1),
+            'projected_memory_mb': round((allowed_output * 3 + fixed_bytes) / (1024 * 1024), 1),
+            'downgraded': False,
+        }, None
+
+    cols, rows = grid_size
+    output_pixels = cols * rows * module_size * module_size
+
+    admission = {
+        'requested_grid': f'{cols}x{rows}',
+        'module_size': module_size,
+        'projected_pixels': output_pixels,
+        'library_memory_mb': round(library_bytes / (1024 * 1024), 1),
+        'downgraded': False,
+    }
+
+    if output_pixels > allowed_output:
+        if not app.config['DOWNGRADE_OVERSIZED']:
+            return grid_size, admission, (
+                f'예상 결과 크기가 너무 큽니다: {cols * module_size}x{rows * module_size} 픽셀 '
+                f'(최대 {allowed_output:,} 픽셀, 메모리 예산 {app.config["MAX_RENDER_MEMORY_MB"]}MB)', 413)
+
+        # 가로세로 비율을 유지하며 미리보기 크기로 그리드 축소
+        preview_pixels = min(app.config['MAX_PREVIEW_PIXELS'], allowed_output)
+        scale = (preview_pixels / output_pixels) ** 0.5
+        cols = max(1, int(cols * scale))
+        rows = max(1, int(rows * scale))
+        grid_size = (cols, rows)
+        output_pixels = cols * rows * module_size * module_size
+        admission['downgraded'] = True
+
+    admission.update({
+        'grid': f'{cols}x{rows}',
+        'output_size': f'{cols * module_size}x{rows * module_size}',
+        'max_output_pixels': allowed_output,
+        'projected_pixels': output_pixels,
+        'projected_memory_mb': round((output_pixels * 3 + fixed_bytes) / (1024 * 1024), 1),
+    })
+    return grid_size, admission, None
+
 def image_to_base64(image_path):
     """이미지를 base64로 인코딩"""
     with Image.open(image_path) as img:
@@ -49,36 +204,45 @@ def analyze_modules():
         if not module_files:
             return jsonify({'error': '모듈 파일을 선택해주세요.'}), 400
 
-        # 임시 모듈 폴더 생성
-        module_folder = os.path.join(app.config['UPLOAD_FOLDER'], 'modules')
-        os.makedirs(module_folder, exist_ok=True)
+        # 디코딩 전에 헤더로 크기 확인
+        _, error = probe_uploads(module_files, app.config['MAX_MODULE_PIXELS'], '모듈')
+        if error:
+            message, status = error
+            return jsonify({'error': message}), status
 
-        # 파일 저장
-        saved_files = []
-        for file in module_files:
-            if file and allowed_file(file.filename):
-                filename = secure_filename(file.filename)
-                filepath = os.path.join(module_folder, filename)
-                file.save(filepath)
-                saved_files.append(filepath)
-
-        if not saved_files:
-            return jsonify({'error': '유효한 이미지 파일이 없습니다.'}), 400
-
-        # 모듈 분석
-        modules_info = []
-        module_brightness = []
+        # 임시 모듈 폴더 생성 (요청마다 따로)
+        os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+        module_folder = tempfile.mkdtemp(prefix='modules_', dir=app.config['UPLOAD_FOLDER'])
 
-        for filepath in saved_files:
-            img = Image.open(filepath).convert('L')
-            brightness = np.array(img).mean()
-
-            modules_info.append({
-                'filename': os.path.basename(filepath),
-                'brightness': float(brightness),
-                'image': image_to_base64(filepath)
-            })
-            module_brightness.append(brightness)
+        try:
+            # 파일 저장
+            saved_files = []
+            for file in module_files:
+                if file and allowed_file(file.filename):
+                    filename = secure_filename(file.filename)
+                    filepath = os.path.join(module_folder, filename)
+                    file.save(filepath)
+                    saved_files.append(filepath)
+
+            if not saved_files:
+                return jsonify({'error': '유효한 이미지 파일이 없습니다.'}), 400
+
+            # 모듈 분석
+            modules_info = []
+            module_brightness = []
+
+            for filepath in saved_files:
+                img = Image.open(filepath).convert('L')
+                brightness = np.array(img).mean()
+
+                modules_info.append({
+                    'filename': os.path.basename(filepath),
+                    'brightness': float(brightness),
+                    'image': image_to_base64(filepath)
+                })
+                module_brightness.append(brightness)
+        finally:
+            shutil.rmtree(module_folder, ignore_errors=True)
 
         # 밝기 순으로 정렬 (어두운 것 -> 밝은 것)
         sorted_modules = sorted(modules_info, key=lambda x: x['brightness'])
@@ -104,29 +268,39 @@ def generate():
         grid_size_str = request.form.get('grid_size', '64x40')
         output_dpi = int(request.form.get('output_dpi', 600))
 
-        try:
-            cols, rows = map(int, grid_size_str.split('x'))
-            grid_size = (cols, rows)
-        except:
-            return jsonify({'error': '잘못된 그리드 크기 형식입니다. (예: 64x40)'}), 400
+        if grid_size_str == 'auto':
+            grid_size = 'auto'  # 타겟마다 예산(MAX_OUTPUT_PIXELS, 메모리 예산) 안에서 품질 기반 탐색
+        else:
+            try:
+                cols, rows = map(int, grid_size_str.split('x'))
+                grid_size = (cols, rows)
+            except:
+                return jsonify({'error': '잘못된 그리드 크기 형식입니다. (예: 64x40 또는 auto)'}), 400
 
         # 모듈 파일 처리
         module_files = request.files.getlist('module_files')
         if not module_files:
             return jsonify({'error': '모듈 파일을 선택해주세요.'}), 400
 
-        # 임시 폴더 경로 설정
-        module_folder = os.path.join(app.config['UPLOAD_FOLDER'], 'modules_gen')
-        target_folder = os.path.join(app.config['UPLOAD_FOLDER'], 'targets')
-        output_folder = os.path.join(app.config['UPLOAD_FOLDER'], 'outputs')
+        target_files = request.files.getlist('target_files')
+        if not target_files:
+            return jsonify({'error': '타겟 파일을 선택해주세요.'}), 400
+
+        # 업로드 허용 여부 판단 (헤더만 읽음, 디코딩/저장 전)
+        grid_size, admission, error = admit_generate(module_files, target_files, grid_size)
+        if error:
+            message, status = error
+            return jsonify({'error': message, 'admission': admission}), status
 
-        # 기존 폴더 삭제 후 재생성 (이전 파일 제거)
-        if os.path.exists(module_folder):
-            shutil.rmtree(module_folder)
-        if os.path.exists(target_folder):
-            shutil.rmtree(target_folder)
-        if os.path.exists(output_folder):
-            shutil.rmtree(output_folder)
+        # 오래된 작업 폴더 정리
+        cleanup_runs()
+
+        # 요청별 작업 폴더 (다른 요청/워커와 겹치지 않음)
+        run_id = uuid.uuid4().hex
+        run_dir = os.path.join(runs_root(), run_id)
+        module_folder = os.path.join(run_dir, 'modules_gen')
+        target_folder = os.path.join(run_dir, 'targets')
+        output_folder = os.path.join(run_dir, 'outputs')
 
         # 폴더 생성
         os.makedirs(module_folder, exist_ok=True)
@@ -139,11 +313,6 @@ def generate():
                 filename = secure_filename(file.filename)
                 file.save(os.path.join(module_folder, filename))
 
-        # 타겟 파일 처리
-        target_files = request.files.getlist('target_files')
-        if not target_files:
-            return jsonify({'error': '타겟 파일을 선택해주세요.'}), 400
-
         # 타겟 파일 저장
         for file in target_files:
             if file and allowed_file(file.filename):
@@ -153,6 +322,9 @@ def generate():
         # MD 파일 저장 폴더
         md_folder = os.path.join(output_folder, 'md')
 
+        # 타일 피라미드 폴더 (URL에 run_id가 들어가므로 브라우저 캐시와 충돌하지 않음)
+        dzi_folder = os.path.join(output_folder, 'tiles')
+
         # 이미지 생성 (폴더 일괄 처리)
         process_folder(
             module_folder=module_folder,
@@ -162,7 +334,10 @@ def generate():
             output_dpi=output_dpi,
             invert=False,
             md_folder=md_folder,
-            copy_images=True  # 웹에서는 이미지 복사
+            copy_images=True,  # 웹에서는 이미지 복사
+            dzi_folder=dzi_folder,
+            use_atlas=True,  # 같은 모듈 라이브러리는 워커 간에 메모리 맵으로 공유
+            max_output_pixels=admission['max_output_pixels']  # 메모리 예산을 반영한 한도
         )
 
         # total.md 파일 읽기
@@ -173,10 +348,17 @@ def generate():
         with open(total_md_path, 'r', encoding='utf-8') as f:
             total_md_content = f.read()
 
+        # 타일 피라미드가 있는 결과는 마스터 대신 피라미드의 작은 레벨을 미리보기로 사용
+        for file in os.listdir(output_folder):
+            dzi_path = os.path.join(dzi_folder, os.path.splitext(file)[0] + '.dzi')
+            if os.path.exists(dzi_path):
+                preview_url = f"/tiles/{run_id}/{dzi_preview_tile(dzi_path)}"
+                total_md_content = total_md_content.replace(f"](images/results/{file})", f"]({preview_url})")
+
         # 마크다운 내 이미지 경로를 웹 경로로 변경
-        # images/modules/xxx.png -> /outputs/md/images/modules/xxx.png
-        # images/results/xxx.png -> /outputs/md/images/results/xxx.png
-        total_md_content = total_md_content.replace('](images/', '](/outputs/md/images/')
+        # images/modules/xxx.png -> /outputs/<run_id>/md/images/modules/xxx.png
+        # images/results/xxx.png -> /outputs/<run_id>/md/images/results/xxx.png
+        total_md_content = total_md_content.replace('](images/', f'](/outputs/{run_id}/md/images/')
 
         # 생성된 파일 목록 (파일명 순서대로 정렬)
         import re
@@ -194,12 +376,22 @@ def generate():
         # 파일명 자연스러운 순으로 정렬 (1, 2, 3, 10이 아니라 1, 2, 3, 10 순서)
         output_files.sort(key=natural_sort_key)
 
+        # 결과 이미지별 DZI 경로 (브라우저는 화면에 보이는 타일만 요청)
+        dzi_files = {}
+        for file in output_files:
+            dzi_name = os.path.splitext(file)[0] + '.dzi'
+            if os.path.exists(os.path.join(dzi_folder, dzi_name)):
+                dzi_files[file] = f"/tiles/{run_id}/{dzi_name}"
+
         return jsonify({
             'success': True,
+            'run_id': run_id,
             'total_md': total_md_content,
             'total_md_path': total_md_path,
             'output_files': output_files,
-            'output_count': len(output_files)
+            'output_count': len(output_files),
+            'dzi_files': dzi_files,
+            'admission': admission
         })
 
     except Exception as e:
@@ -210,8 +402,10 @@ def generate():
 def download_md():
     """total.md 파일 다운로드"""
     try:
-        md_folder = os.path.join(app.config['UPLOAD_FOLDER'], 'outputs', 'md')
-        total_md_path = os.path.join(md_folder, 'total.md')
+        folder = run_folder(request.args.get('run_id'))
+        if folder is None:
+            return jsonify({'error': '작업을 찾을 수 없습니다.'}), 404
+        total_md_path = os.path.join(folder, 'outputs', 'md', 'total.md')
 
         if not os.path.exists(total_md_path):
             return jsonify({'error': 'total.md 파일을 찾을 수 없습니다.'}), 404
@@ -227,12 +421,18 @@ def download_results():
     try:
         import zipfile
 
-        output_folder = os.path.join(app.config['UPLOAD_FOLDER'], 'outputs')
+        folder = run_folder(request.args.get('run_id'))
+        if folder is None:
+            return jsonify({'error': '작업을 찾을 수 없습니다.'}), 404
+        output_folder = os.path.join(folder, 'outputs')
 
         # ZIP 파일 생성
-        zip_path = os.path.join(app.config['UPLOAD_FOLDER'], 'results.zip')
+        zip_path = os.path.join(folder, 'results.zip')
         with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
             for root, dirs, files in os.walk(output_folder):
+                # 타일 피라미드는 브라우저 보기용이므로 제외
+                if root == output_folder and 'tiles' in dirs:
+                    dirs.remove('tiles')
                 for file in files:
                     file_path = os.path.join(root, file)
                     arcname = os.path.relpath(file_path, output_folder)
@@ -243,11 +443,22 @@ def download_results():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/outputs/<path:filename>')
-def output_file(filename):
+@app.route('/outputs/<run_id>/<path:filename>')
+def output_file(run_id, filename):
     """생성된 파일 서빙"""
-    output_folder = os.path.join(app.config['UPLOAD_FOLDER'], 'outputs')
-    return send_from_directory(output_folder, filename)
+    folder = run_folder(run_id)
+    if folder is None:
+        return jsonify({'error': '작업을 찾을 수 없습니다.'}), 404
+    return send_from_directory(os.path.join(folder, 'outputs'), filename)
+
+@app.route('/tiles/<run_id>/<path:filename>')
+def tile_file(run_id, filename):
+    """Deep Zoom 타일 서빙 (장기 캐시)"""
+    folder = run_folder(run_id)
+    if folder is None:
+        return jsonify({'error': '작업을 찾을 수 없습니다.'}), 404
+    tiles_folder = os.path.join(folder, 'outputs', 'tiles')
+    return send_from_directory(tiles_folder, filename, max_age=app.config['TILE_CACHE_MAX_AGE'])
 
 @app.route('/uploads/<path:filename>')
 def uploaded_file(filename):